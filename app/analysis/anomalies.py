@@ -1,38 +1,35 @@
 from ..qbo_client import QBOClient
+from ..streaming import encode_cursor, decode_cursor
+import math
 import statistics
 
+# Entity -> reference field holding the counterparty name.
+TXN_ENTITIES = [("Invoice", "CustomerRef"), ("Purchase", "EntityRef")]
+
+
+def _to_txn(entity: str, ref_field: str, obj: dict) -> dict:
+    return {
+        "type": entity,
+        "id": obj.get("Id"),
+        "name": obj.get(ref_field, {}).get("name", "Unknown"),
+        "date": obj.get("TxnDate"),
+        "amount": obj.get("TotalAmt", 0.0),
+    }
+
+
+def _z_score(amount: float, mean_amt: float, stdev_amt: float) -> float:
+    return (amount - mean_amt) / stdev_amt if stdev_amt > 0 else 0.0
+
+
 def transaction_anomalies(qbo_client: QBOClient, limit: int = 1000, z_threshold: float = 2.5):
     """
     Simple anomaly detector: looks at Invoice and Purchase amounts and flags
     transactions with unusually high amounts (z-score above threshold).
     """
     txns = []
-
-    inv_data = qbo_client.query(f"SELECT * FROM Invoice STARTPOSITION 1 MAXRESULTS {limit}")
-    for inv in inv_data.get("QueryResponse", {}).get("Invoice", []):
-        amt = inv.get("TotalAmt", 0.0)
-        txns.append(
-            {
-                "type": "Invoice",
-                "id": inv.get("Id"),
-                "name": inv.get("CustomerRef", {}).get("name", "Unknown"),
-                "date": inv.get("TxnDate"),
-                "amount": amt,
-            }
-        )
-
-    pur_data = qbo_client.query(f"SELECT * FROM Purchase STARTPOSITION 1 MAXRESULTS {limit}")
-    for p in pur_data.get("QueryResponse", {}).get("Purchase", []):
-        amt = p.get("TotalAmt", 0.0)
-        txns.append(
-            {
-                "type": "Purchase",
-                "id": p.get("Id"),
-                "name": p.get("EntityRef", {}).get("name", "Unknown"),
-                "date": p.get("TxnDate"),
-                "amount": amt,
-            }
-        )
+    for entity, ref_field in TXN_ENTITIES:
+        for obj in qbo_client.query_entities(entity, max_results=limit):
+            txns.append(_to_txn(entity, ref_field, obj))
 
     amounts = [t["amount"] for t in txns]
     if len(amounts) < 2:
@@ -47,10 +44,7 @@ def transaction_anomalies(qbo_client: QBOClient, limit: int = 1000, z_threshold:
 
     anomalies = []
     for t in txns:
-        if stdev_amt > 0:
-            z = (t["amount"] - mean_amt) / stdev_amt
-        else:
-            z = 0.0
+        z = _z_score(t["amount"], mean_amt, stdev_amt)
         if z >= z_threshold:
             t_with_z = dict(t)
             t_with_z["z_score"] = z
@@ -62,3 +56,102 @@ def transaction_anomalies(qbo_client: QBOClient, limit: int = 1000, z_threshold:
         "transactions": txns,
         "anomalies": sorted(anomalies, key=lambda x: x["z_score"], reverse=True),
     }
+
+
+# --- Streaming / paginated variants ---
+#
+# These make two passes over QBO: one to compute the summary statistics and
+# one to emit scored rows. Only a single QBO page is held in memory at a time.
+
+def _iter_transactions(qbo_client: QBOClient, limit: int):
+    for entity, ref_field in TXN_ENTITIES:
+        for obj in qbo_client.iter_entities(entity, limit=limit):
+            yield _to_txn(entity, ref_field, obj)
+
+
+def transaction_anomalies_summary(qbo_client: QBOClient, limit: int = 1000):
+    """
+    Count, mean and population stdev of transaction amounts, computed in one
+    streaming pass (Welford).
+    """
+    count, mean_amt, m2 = 0, 0.0, 0.0
+    for t in _iter_transactions(qbo_client, limit):
+        count += 1
+        delta = t["amount"] - mean_amt
+        mean_amt += delta / count
+        m2 += delta * (t["amount"] - mean_amt)
+
+    return {
+        "count": count,
+        "mean_amount": mean_amt,
+        "stdev_amount": math.sqrt(m2 / count) if count else 0.0,
+    }
+
+
+def _score(t: dict, mean_amt: float, stdev_amt: float, z_threshold: float) -> dict:
+    z = _z_score(t["amount"], mean_amt, stdev_amt)
+    return dict(t, z_score=z, is_anomaly=z >= z_threshold)
+
+
+def iter_scored_transactions(
+    qbo_client: QBOClient,
+    summary: dict,
+    limit: int = 1000,
+    z_threshold: float = 2.5,
+):
+    """
+    Yield every transaction with its z_score and is_anomaly flag.
+    """
+    for t in _iter_transactions(qbo_client, limit):
+        yield _score(t, summary["mean_amount"], summary["stdev_amount"], z_threshold)
+
+
+def transaction_anomalies_page(
+    qbo_client: QBOClient,
+    limit: int = 1000,
+    z_threshold: float = 2.5,
+    page_size: int = 100,
+    cursor: str | None = None,
+):
+    """
+    One page of scored transactions. The summary is only computed and
+    returned on the first page; its mean/stdev travel in the cursor so later
+    pages cost a single QBO query.
+    """
+    if cursor:
+        state = decode_cursor(
+            cursor,
+            {"e": int, "p": int, "mean": (int, float), "std": (int, float)},
+            lambda s: s["e"] >= 0 and s["p"] >= 1 and s["std"] >= 0,
+        )
+        summary = None
+    else:
+        summary = transaction_anomalies_summary(qbo_client, limit)
+        state = {
+            "e": 0,
+            "p": 1,
+            "mean": summary["mean_amount"],
+            "std": summary["stdev_amount"],
+        }
+
+    rows = []
+    e, p = state["e"], state["p"]
+    while e < len(TXN_ENTITIES) and len(rows) < page_size:
+        want = min(page_size - len(rows), limit - p + 1)
+        entity, ref_field = TXN_ENTITIES[e]
+        batch = qbo_client.query_entities(entity, start=p, max_results=want) if want > 0 else []
+        for obj in batch:
+            rows.append(_score(_to_txn(entity, ref_field, obj), state["mean"], state["std"], z_threshold))
+        p += len(batch)
+        if len(batch) < want or want <= 0:
+            e, p = e + 1, 1
+
+    next_cursor = None
+    if e < len(TXN_ENTITIES):
+        next_cursor = encode_cursor(dict(state, e=e, p=p))
+
+    return {
+        "summary": summary,
+        "transactions": rows,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,159 @@
+from ..qbo_client import QBOClient
+from ..db import advisory_xact_lock
+from ..models import AnomalyCursor, AnomalyStat, FlaggedAnomaly
+from .anomalies import TXN_ENTITIES
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import math
+
+TYPE_BASELINE = ""  # AnomalyStat.counterparty value for the per-type baseline
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def _stdev(stat: AnomalyStat) -> float:
+    return math.sqrt(stat.m2 / stat.count) if stat.count else 0.0
+
+
+def _update(stat: AnomalyStat, amount: float) -> None:
+    stat.count += 1
+    delta = amount - stat.mean
+    stat.mean += delta / stat.count
+    stat.m2 += delta * (amount - stat.mean)
+
+
+def _flagged_dict(row: FlaggedAnomaly) -> dict:
+    return {
+        "type": row.txn_type,
+        "id": row.txn_id,
+        "name": row.name,
+        "date": row.txn_date,
+        "amount": row.amount,
+        "z_score": row.z_score,
+        "baseline": row.baseline,
+        "baseline_mean": row.baseline_mean,
+        "baseline_stdev": row.baseline_stdev,
+    }
+
+
+def incremental_transaction_anomalies(
+    qbo_client: QBOClient,
+    db: Session,
+    z_threshold: float = 3.0,
+    min_history: int = 5,
+):
+    """
+    Per-counterparty anomaly detector that only looks at transactions created
+    since the last run.
+
+    Each new Invoice / Purchase is scored against the running mean/stdev of
+    its own counterparty (falling back to the whole transaction type until
+    the counterparty has `min_history` transactions), then folded into those
+    statistics. Statistics, the CreateTime watermark and flagged transactions
+    persist per realm, so cost scales with new activity rather than history.
+    """
+    realm_id = qbo_client.realm_id
+    # Held until commit, so concurrent runs for a realm (including the very
+    # first, before any cursor row exists) never fold the same rows twice.
+    advisory_xact_lock(db, f"anomalies:{realm_id}")
+    stats: Dict[Tuple[str, str], AnomalyStat] = {
+        (s.txn_type, s.counterparty): s
+        for s in db.query(AnomalyStat).filter(AnomalyStat.realm_id == realm_id)
+    }
+
+    def stat_for(txn_type: str, counterparty: str) -> AnomalyStat:
+        key = (txn_type, counterparty)
+        if key not in stats:
+            stats[key] = AnomalyStat(
+                realm_id=realm_id, txn_type=txn_type, counterparty=counterparty,
+                count=0, mean=0.0, m2=0.0,
+            )
+            db.add(stats[key])
+        return stats[key]
+
+    anomalies = []
+    processed = 0
+
+    for entity, ref_field in TXN_ENTITIES:
+        cursor = (
+            db.query(AnomalyCursor)
+            .filter(AnomalyCursor.realm_id == realm_id, AnomalyCursor.txn_type == entity)
+            .first()
+        )
+        if cursor is None:
+            cursor = AnomalyCursor(realm_id=realm_id, txn_type=entity)
+            db.add(cursor)
+
+        where = f"MetaData.CreateTime > '{cursor.last_created}'" if cursor.last_created else ""
+        new_txns = list(qbo_client.iter_entities(entity, where))
+        new_txns.sort(key=lambda t: _parse_time(t.get("MetaData", {}).get("CreateTime", "1970-01-01T00:00:00Z")))
+
+        for obj in new_txns:
+            ref = obj.get(ref_field, {})
+            counterparty = ref.get("value") or ref.get("name") or "Unknown"
+            amount = obj.get("TotalAmt", 0.0)
+
+            cp_stat = stat_for(entity, counterparty)
+            type_stat = stat_for(entity, TYPE_BASELINE)
+            baseline, stat = (
+                ("counterparty", cp_stat) if cp_stat.count >= min_history
+                else ("type", type_stat)
+            )
+
+            stdev = _stdev(stat)
+            if stat.count >= 2 and stdev > 0:
+                z = (amount - stat.mean) / stdev
+                if z >= z_threshold:
+                    flagged = FlaggedAnomaly(
+                        realm_id=realm_id,
+                        txn_type=entity,
+                        txn_id=obj.get("Id"),
+                        name=ref.get("name", "Unknown"),
+                        txn_date=obj.get("TxnDate"),
+                        amount=amount,
+                        z_score=z,
+                        baseline=baseline,
+                        baseline_mean=stat.mean,
+                        baseline_stdev=stdev,
+                    )
+                    db.add(flagged)
+                    anomalies.append(_flagged_dict(flagged))
+
+            _update(cp_stat, amount)
+            _update(type_stat, amount)
+            processed += 1
+
+            created = obj.get("MetaData", {}).get("CreateTime")
+            if created and (
+                not cursor.last_created
+                or _parse_time(created) > _parse_time(cursor.last_created)
+            ):
+                cursor.last_created = _parse_time(created).isoformat()
+
+    db.commit()
+
+    return {
+        "processed": processed,
+        "counterparties_tracked": sum(1 for (_, cp) in stats if cp != TYPE_BASELINE),
+        "anomalies": sorted(anomalies, key=lambda x: x["z_score"], reverse=True),
+    }
+
+
+def flagged_anomalies(
+    db: Session,
+    realm_id: str,
+    since: Optional[str] = None,
+    limit: int = 100,
+) -> List[dict]:
+    """
+    Anomalies previously flagged for a realm, newest transactions first.
+    `since` (ISO date) keeps only transactions dated on or after it.
+    """
+    q = db.query(FlaggedAnomaly).filter(FlaggedAnomaly.realm_id == realm_id)
+    if since:
+        q = q.filter(FlaggedAnomaly.txn_date >= since)
+    rows = q.order_by(FlaggedAnomaly.txn_date.desc(), FlaggedAnomaly.id.desc()).limit(limit)
+    return [_flagged_dict(r) for r in rows]
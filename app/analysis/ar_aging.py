@@ -1,60 +1,266 @@
 from ..qbo_client import QBOClient
-from datetime import datetime, date
+from ..streaming import encode_cursor, decode_cursor
+from datetime import datetime, date, timedelta
 from collections import defaultdict
+from typing import List
 
-def ar_aging(qbo_client: QBOClient, limit: int = 1000):
+import numpy as np
+
+OPEN_INVOICES = "Balance > 0"
+
+
+def _aging_row(inv: dict, today: date):
     """
-    Computes AR aging buckets for open invoices:
-      0-30, 31-60, 61-90, 90+ days past due.
+    Aging detail for one open invoice, or None if it has no usable date.
     """
-    today = date.today()
-    query = f"SELECT * FROM Invoice WHERE Balance > 0 STARTPOSITION 1 MAXRESULTS {limit}"
-    data = qbo_client.query(query)
+    balance = inv.get("Balance", 0.0)
+    due_str = inv.get("DueDate") or inv.get("TxnDate")
+    if not due_str:
+        return None
+    try:
+        due_date = datetime.strptime(due_str, "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+    days_past_due = (today - due_date).days
+
+    if days_past_due <= 30:
+        bucket = "0-30"
+    elif days_past_due <= 60:
+        bucket = "31-60"
+    elif days_past_due <= 90:
+        bucket = "61-90"
+    else:
+        bucket = "90+"
 
-    buckets = {
+    return {
+        "invoice_id": inv.get("Id"),
+        "customer": inv.get("CustomerRef", {}).get("name", "Unknown"),
+        "balance": balance,
+        "due_date": due_str,
+        "days_past_due": days_past_due,
+        "bucket": bucket,
+    }
+
+
+def _empty_buckets():
+    return {
         "0-30": 0.0,
         "31-60": 0.0,
         "61-90": 0.0,
         "90+": 0.0,
     }
+
+
+def ar_aging(qbo_client: QBOClient, limit: int = 1000):
+    """
+    Computes AR aging buckets for open invoices:
+      0-30, 31-60, 61-90, 90+ days past due.
+    """
+    today = date.today()
+    invoices = qbo_client.query_entities("Invoice", OPEN_INVOICES, max_results=limit)
+
+    buckets = _empty_buckets()
     detail = []
 
-    invoices = data.get("QueryResponse", {}).get("Invoice", [])
     for inv in invoices:
-        balance = inv.get("Balance", 0.0)
-        due_str = inv.get("DueDate") or inv.get("TxnDate")
-        if not due_str:
-            continue
-        try:
-            due_date = datetime.strptime(due_str, "%Y-%m-%d").date()
-        except Exception:
+        row = _aging_row(inv, today)
+        if row is None:
             continue
+        buckets[row["bucket"]] += row["balance"]
+        detail.append(row)
 
-        days_past_due = (today - due_date).days
+    return {
+        "as_of": today.isoformat(),
+        "buckets": buckets,
+        "invoices": detail,
+    }
 
-        if days_past_due <= 30:
-            bucket = "0-30"
-        elif days_past_due <= 60:
-            bucket = "31-60"
-        elif days_past_due <= 90:
-            bucket = "61-90"
-        else:
-            bucket = "90+"
 
-        buckets[bucket] += balance
-        detail.append(
-            {
-                "invoice_id": inv.get("Id"),
-                "customer": inv.get("CustomerRef", {}).get("name", "Unknown"),
-                "balance": balance,
-                "due_date": due_str,
-                "days_past_due": days_past_due,
-                "bucket": bucket,
-            }
-        )
+# --- Streaming / paginated variants ---
+
+def ar_aging_summary(qbo_client: QBOClient, limit: int = 1000, today: date | None = None):
+    """
+    Bucket totals and invoice count, computed in one streaming pass.
+    """
+    today = today or date.today()
+    buckets = _empty_buckets()
+    count = 0
+    for inv in qbo_client.iter_entities("Invoice", OPEN_INVOICES, limit=limit):
+        row = _aging_row(inv, today)
+        if row is None:
+            continue
+        buckets[row["bucket"]] += row["balance"]
+        count += 1
 
     return {
         "as_of": today.isoformat(),
         "buckets": buckets,
-        "invoices": detail,
+        "invoice_count": count,
     }
+
+
+def iter_ar_aging_rows(qbo_client: QBOClient, limit: int = 1000, today: date | None = None):
+    """
+    Yield aging detail rows for every open invoice, one QBO page at a time.
+    """
+    today = today or date.today()
+    for inv in qbo_client.iter_entities("Invoice", OPEN_INVOICES, limit=limit):
+        row = _aging_row(inv, today)
+        if row is not None:
+            yield row
+
+
+def _valid_page_state(state) -> bool:
+    date.fromisoformat(state["as_of"])  # ValueError -> invalid cursor
+    return state["p"] >= 1
+
+
+def ar_aging_page(
+    qbo_client: QBOClient,
+    limit: int = 1000,
+    page_size: int = 100,
+    cursor: str | None = None,
+):
+    """
+    One page of aging detail rows. The summary is only computed and returned
+    on the first page; the as-of date travels in the cursor so every page
+    ages invoices against the same day.
+    """
+    if cursor:
+        state = decode_cursor(
+            cursor,
+            {"p": int, "as_of": str},
+            _valid_page_state,
+        )
+        summary = None
+    else:
+        summary = ar_aging_summary(qbo_client, limit)
+        state = {"p": 1, "as_of": summary["as_of"]}
+
+    today = date.fromisoformat(state["as_of"])
+    want = min(page_size, limit - state["p"] + 1)
+    batch = (
+        qbo_client.query_entities("Invoice", OPEN_INVOICES, state["p"], want)
+        if want > 0 else []
+    )
+    rows = [r for r in (_aging_row(inv, today) for inv in batch) if r is not None]
+
+    next_cursor = None
+    if want > 0 and len(batch) == want:
+        next_cursor = encode_cursor(dict(state, p=state["p"] + want))
+
+    return {
+        "summary": summary,
+        "invoices": rows,
+        "next_cursor": next_cursor,
+    }
+
+
+# --- Historical / as-of aging ---
+
+AGING_BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+# ar_aging_history allocates several (dates x invoices) arrays.
+MAX_AS_OF_DATES = 120
+# Lower edges (days past due) of every bucket after the first.
+_BUCKET_EDGES = np.array([31, 61, 91])
+
+
+def _to_days(values) -> np.ndarray:
+    """
+    Parse ISO date strings into int64 days since the epoch. Missing or
+    malformed values (e.g. "2024-13-01") become NaT.
+    """
+    def parse(value):
+        try:
+            return np.datetime64(value[:10], "D") if value else np.datetime64("NaT")
+        except (TypeError, ValueError):
+            return np.datetime64("NaT")
+
+    parsed = np.array([parse(v) for v in values], dtype="datetime64[D]")
+    return parsed.astype("int64")
+
+
+def ar_aging_history(qbo_client: QBOClient, as_of_dates: List[date]):
+    """
+    AR aging buckets as of each date in `as_of_dates`.
+
+    Every Invoice and Payment is fetched once (all pages). An invoice's open
+    amount at date D is its current balance plus the payments applied to it
+    after D, counted only if the invoice existed by D. Reductions that did
+    not come from a Payment (credits, journal entries) are treated as
+    applied on the invoice date. Buckets for all dates are then computed in
+    one vectorized pass over the (dates x invoices) matrix.
+    """
+    invoices = list(qbo_client.iter_entities("Invoice"))
+    payments = list(qbo_client.iter_entities("Payment"))
+
+    ids = {inv.get("Id"): i for i, inv in enumerate(invoices)}
+    txn_days = _to_days([inv.get("TxnDate") for inv in invoices])
+    due_days = _to_days([inv.get("DueDate") or inv.get("TxnDate") for inv in invoices])
+    balance = np.array([inv.get("Balance", 0.0) for inv in invoices], dtype=float)
+
+    pay_inv, pay_date, pay_amt = [], [], []
+    for p in payments:
+        for line in p.get("Line", []):
+            for link in line.get("LinkedTxn", []):
+                if link.get("TxnType") == "Invoice" and link.get("TxnId") in ids:
+                    pay_inv.append(ids[link["TxnId"]])
+                    pay_date.append(p.get("TxnDate"))
+                    pay_amt.append(line.get("Amount", 0.0))
+                    break
+    pay_inv = np.array(pay_inv, dtype=np.int64)
+    pay_days = _to_days(pay_date)
+    pay_amt = np.array(pay_amt, dtype=float)
+
+    nat = np.iinfo(np.int64).min
+    valid = (txn_days != nat) & (due_days != nat)
+    as_of = _to_days([d.isoformat() for d in as_of_dates])
+    k, n = len(as_of), len(invoices)
+
+    # Payments applied after each as-of date, summed per invoice: (k x n).
+    later = (pay_days[None, :] > as_of[:, None]) & (pay_days[None, :] != nat)
+    flat_idx = (np.arange(k)[:, None] * n + pay_inv[None, :]).ravel()
+    paid_later = np.bincount(
+        flat_idx, weights=(later * pay_amt[None, :]).ravel(), minlength=k * n
+    ).reshape(k, n)
+
+    open_amt = balance[None, :] + paid_later
+    open_amt = np.where((txn_days[None, :] <= as_of[:, None]) & valid[None, :], open_amt, 0.0)
+    is_open = open_amt > 0.005
+
+    days_past_due = as_of[:, None] - due_days[None, :]
+    bucket_idx = np.digitize(days_past_due, _BUCKET_EDGES)
+    totals = np.bincount(
+        (np.arange(k)[:, None] * len(AGING_BUCKETS) + bucket_idx).ravel(),
+        weights=np.where(is_open, open_amt, 0.0).ravel(),
+        minlength=k * len(AGING_BUCKETS),
+    ).reshape(k, len(AGING_BUCKETS))
+
+    return {
+        "as_of": [
+            {
+                "as_of": d.isoformat(),
+                "buckets": dict(zip(AGING_BUCKETS, totals[row].tolist())),
+                "total_open": float(totals[row].sum()),
+                "open_invoice_count": int(is_open[row].sum()),
+            }
+            for row, d in enumerate(as_of_dates)
+        ],
+        "invoices_considered": n,
+        "payments_considered": len(payments),
+    }
+
+
+def month_ends(count: int, today: date | None = None) -> List[date]:
+    """
+    The last `count` completed month-ends, oldest first.
+    """
+    today = today or date.today()
+    d = date(today.year, today.month, 1)
+    ends = []
+    for _ in range(count):
+        d_end = d - timedelta(days=1)
+        ends.append(d_end)
+        d = date(d_end.year, d_end.month, 1)
+    return ends[::-1]
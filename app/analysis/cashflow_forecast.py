@@ -1,13 +1,30 @@
+from ..cache import cache
 from ..qbo_client import QBOClient
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
 import statistics
 
-def cashflow_forecast(qbo_client: QBOClient, horizon_months: int = 3):
+import numpy as np
+
+def cashflow_forecast(
+    qbo_client: QBOClient,
+    horizon_months: int = 3,
+    mode: str = "simple",
+    years: int = 3,
+):
     """
     Very simple cash flow forecast based on ProfitAndLoss summarized by month.
     Not production-grade, but gives a sense of trend:
       cash_flow_month = income - cogs - expenses
+
+    mode="seasonal" uses `years` prior fiscal years instead; see
+    seasonal_cashflow_forecast.
     """
+    if mode == "seasonal":
+        return seasonal_cashflow_forecast(qbo_client, horizon_months, years)
+
     report = qbo_client.get_report(
         "ProfitAndLoss",
         {
@@ -67,3 +84,238 @@ def cashflow_forecast(qbo_client: QBOClient, horizon_months: int = 3):
         "avg_monthly_cash_flow": avg_cf,
         "forecast": forecast,
     }
+
+
+# --- Seasonal, multi-year forecast ---
+
+# Closed fiscal years rarely change (only through back-dated entries), so
+# their monthly cash flow is fetched once per realm and shared via the cache.
+CLOSED_YEAR_TTL = 7 * 24 * 3600  # seconds
+# Concurrent P&L report requests per forecast, to stay well inside QBO's
+# per-realm concurrency limit.
+MAX_REPORT_WORKERS = 4
+
+PNL_GROUPS = ("Income", "COGS", "Expenses")
+
+MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June", "July",
+    "August", "September", "October", "November", "December",
+]
+
+
+def add_months(d: date, months: int) -> date:
+    y, m = divmod(d.month - 1 + months, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _fiscal_year_start_month(qbo_client: QBOClient) -> int:
+    """
+    First month of the fiscal year (1-12) from company Preferences; January
+    if it cannot be determined.
+    """
+    try:
+        data = qbo_client.query("SELECT * FROM Preferences")
+        prefs = data.get("QueryResponse", {}).get("Preferences", [{}])[0]
+        name = prefs.get("AccountingInfoPrefs", {}).get("FirstMonthOfFiscalYear", "January")
+        return MONTH_NAMES.index(name) + 1
+    except Exception:
+        return 1
+
+
+def monthly_pnl_groups(qbo_client: QBOClient, start: date, end: date) -> Dict[str, List[float]]:
+    """
+    Monthly Income, COGS and Expenses totals between start and end
+    (inclusive), read from the Summary rows of a ProfitAndLoss report.
+    """
+    report = qbo_client.get_report(
+        "ProfitAndLoss",
+        {
+            "summarize_column_by": "Month",
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+        },
+    )
+
+    cols = report.get("Columns", {}).get("Column", [])
+    # First column is the account name; drop the trailing "Total" column.
+    month_idx = [
+        i for i, c in enumerate(cols)
+        if i > 0 and c.get("ColType") == "Money" and c.get("ColTitle") != "Total"
+    ]
+    groups = {g: np.zeros(len(month_idx)) for g in PNL_GROUPS}
+
+    for section in report.get("Rows", {}).get("Row", []):
+        if section.get("type") != "Section":
+            continue
+        group = section.get("group", "")
+        if not group:
+            # Older report payloads omit "group"; fall back to the header.
+            title = section.get("Header", {}).get("ColData", [{}])[0].get("value", "")
+            if "Cost of Goods Sold" in title:
+                group = "COGS"
+            elif "Income" in title:
+                group = "Income"
+            elif "Expenses" in title:
+                group = "Expenses"
+            else:
+                continue
+        elif group not in groups:
+            continue
+
+        cells = section.get("Summary", {}).get("ColData", [])
+        groups[group] += np.array([
+            float((cells[i].get("value") or 0) if i < len(cells) else 0)
+            for i in month_idx
+        ])
+
+    return {g: values.tolist() for g, values in groups.items()}
+
+
+def _monthly_cash_flow(qbo_client: QBOClient, start: date, end: date) -> List[float]:
+    """
+    Monthly income - COGS - expenses between start and end (inclusive).
+    """
+    groups = monthly_pnl_groups(qbo_client, start, end)
+    return (
+        np.array(groups["Income"]) - np.array(groups["COGS"]) - np.array(groups["Expenses"])
+    ).tolist()
+
+
+def _closed_year_key(realm_id: str, start: date) -> str:
+    return f"pnl:{realm_id}:cash_flow:{start.isoformat()}"
+
+
+def _fetch_year_windows(
+    qbo_client: QBOClient,
+    windows: List[Tuple[date, date, bool]],
+) -> List[List[float]]:
+    """
+    Fetch monthly cash flow for each (start, end, closed) window concurrently,
+    serving closed years from the cache.
+    """
+    results: List[Optional[List[float]]] = [None] * len(windows)
+    to_fetch = []
+    for i, (start, end, closed) in enumerate(windows):
+        cached = cache.get(_closed_year_key(qbo_client.realm_id, start)) if closed else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            to_fetch.append(i)
+
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=min(MAX_REPORT_WORKERS, len(to_fetch))) as pool:
+            futures = {
+                i: pool.submit(_monthly_cash_flow, qbo_client, windows[i][0], windows[i][1])
+                for i in to_fetch
+            }
+            for i, future in futures.items():
+                results[i] = future.result()
+                start, _, closed = windows[i]
+                if closed:
+                    cache.set(
+                        _closed_year_key(qbo_client.realm_id, start),
+                        results[i],
+                        ttl=CLOSED_YEAR_TTL,
+                    )
+
+    return results
+
+
+def seasonal_cashflow_forecast(
+    qbo_client: QBOClient,
+    horizon_months: int = 3,
+    years: int = 3,
+    confidence: float = 0.95,
+):
+    """
+    Cash flow forecast using `years` prior fiscal years plus the current
+    fiscal year to date (complete months only).
+
+    Fits a linear trend and an additive monthly seasonal profile over the
+    (year x month) matrix, and returns a forecast with confidence bands
+    widening with the horizon.
+    """
+    today = date.today()
+    fy_month = _fiscal_year_start_month(qbo_client)
+    fy_start = date(today.year if today.month >= fy_month else today.year - 1, fy_month, 1)
+    current_month = date(today.year, today.month, 1)
+
+    windows = []
+    for k in range(years, 0, -1):
+        start = add_months(fy_start, -12 * k)
+        end = add_months(start, 12) - timedelta(days=1)
+        windows.append((start, end, True))
+    if current_month > fy_start:
+        windows.append((fy_start, current_month - timedelta(days=1), False))
+
+    yearly = _fetch_year_windows(qbo_client, windows)
+
+    # Month matrix: one row per fiscal year, NaN where a month has no data yet.
+    matrix = np.full((len(windows), 12), np.nan)
+    for row, values in enumerate(yearly):
+        n = min(len(values), 12)
+        matrix[row, :n] = values[:n]
+
+    y = matrix.ravel()
+    observed = ~np.isnan(y)
+    last = int(np.flatnonzero(observed)[-1]) + 1 if observed.any() else 0
+    y = y[:last]
+    observed = observed[:last]
+    n = int(observed.sum())
+    first_month = add_months(fy_start, -12 * years)
+
+    historical = [
+        {"month": add_months(first_month, i).strftime("%Y-%m"), "cash_flow": float(y[i])}
+        for i in range(last)
+        if observed[i]
+    ]
+
+    if n < 2:
+        return {
+            "message": "Not enough monthly history to fit a seasonal model.",
+            "historical": historical,
+            "forecast": [],
+        }
+
+    t = np.arange(last)
+    slope, intercept = np.polyfit(t[observed], y[observed], 1)
+    detrended = np.where(observed, y - (slope * t + intercept), np.nan)
+
+    # Seasonal profile only once every fiscal month has been seen at least once.
+    seasonal = np.zeros(12)
+    if n >= 12:
+        padded = np.full(matrix.size, np.nan)
+        padded[:last] = detrended
+        seasonal = np.nanmean(padded.reshape(-1, 12), axis=0)
+        seasonal = np.nan_to_num(seasonal - np.nanmean(seasonal))
+
+    fitted = slope * t + intercept + seasonal[t % 12]
+    residuals = (y - fitted)[observed]
+    sigma = float(np.std(residuals, ddof=1))
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    h = np.arange(1, horizon_months + 1)
+    t_future = last - 1 + h
+    point = slope * t_future + intercept + seasonal[t_future % 12]
+    width = z * sigma * np.sqrt(1 + h / n)
+
+    forecast = [
+        {
+            "month": add_months(first_month, int(t_future[i])).strftime("%Y-%m"),
+            "cash_flow": float(point[i]),
+            "lower": float(point[i] - width[i]),
+            "upper": float(point[i] + width[i]),
+        }
+        for i in range(horizon_months)
+    ]
+
+    return {
+        "historical": historical,
+        "trend_per_month": float(slope),
+        "seasonal_index": {
+            MONTH_NAMES[(fy_month - 1 + i) % 12]: float(seasonal[i]) for i in range(12)
+        },
+        "residual_stdev": sigma,
+        "confidence": confidence,
+        "forecast": forecast,
+    }
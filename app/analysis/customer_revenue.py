@@ -1,10 +1,27 @@
 from ..qbo_client import QBOClient
+from .rollups import refresh_rollups, totals_by_counterparty
 from collections import defaultdict
+from sqlalchemy.orm import Session
 
-def customer_revenue_summary(qbo_client: QBOClient, limit: int = 1000):
+def customer_revenue_summary(qbo_client: QBOClient, limit: int = 1000, db: Session | None = None):
     """
     Returns revenue per customer based on Invoices.
+
+    With `db`, answers from the monthly rollup tables (refreshed
+    incrementally first) instead of re-pulling invoices; `limit` is ignored.
     """
+    if db is not None:
+        refresh_rollups(qbo_client, db)
+        sorted_customers = [
+            (customer or "Unknown Customer", amount)
+            for customer, amount in totals_by_counterparty(db, qbo_client.realm_id, ["Invoice"])
+        ]
+        return {
+            "total_customers": len(sorted_customers),
+            "top_5_customers": sorted_customers[:5],
+            "customer_breakdown": sorted_customers,
+        }
+
     revenue = defaultdict(float)
 
     invoices = qbo_client.query(f"SELECT * FROM Invoice STARTPOSITION 1 MAXRESULTS {limit}")
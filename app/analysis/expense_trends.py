@@ -1,11 +1,25 @@
 from ..qbo_client import QBOClient
+from .rollups import refresh_rollups, totals_by_month
 from collections import defaultdict
+from sqlalchemy.orm import Session
 import datetime
 
-def expense_trend_mom(qbo_client: QBOClient, limit: int = 1000):
+def expense_trend_mom(qbo_client: QBOClient, limit: int = 1000, db: Session | None = None):
     """
     Returns month-over-month expense totals.
+
+    With `db`, answers from the monthly rollup tables (refreshed
+    incrementally first) instead of re-pulling purchases; `limit` is ignored.
     """
+    if db is not None:
+        refresh_rollups(qbo_client, db)
+        trend = totals_by_month(db, qbo_client.realm_id, ["Purchase"])
+        return {
+            "months": [m for m, _ in trend],
+            "expense_totals": [v for _, v in trend],
+            "month_over_month": trend,
+        }
+
     monthly = defaultdict(float)
 
     purchases = qbo_client.query(f"SELECT * FROM Purchase STARTPOSITION 1 MAXRESULTS {limit}")
@@ -0,0 +1,268 @@
+from ..qbo_client import QBOClient, cdc_truncated
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import threading
+
+# Entity -> (default counterparty kind, reference field)
+INDEXED_ENTITIES = {
+    "Invoice": ("customer", "CustomerRef"),
+    "Purchase": ("vendor", "EntityRef"),
+    "Bill": ("vendor", "VendorRef"),
+}
+
+TxnKey = Tuple[str, str]  # (entity, Id)
+
+# Webhooks only reach the worker that received them, so every index also
+# catches up through CDC once it is this old; past CDC_MAX_AGE it is rebuilt.
+INDEX_SYNC_INTERVAL = timedelta(seconds=60)
+CDC_MAX_AGE = timedelta(days=29)
+
+MAX_INDEXED_REALMS = 32  # least recently used indexes are evicted beyond this
+
+
+def _normalize(entity: str, obj: dict) -> dict:
+    default_kind, ref_field = INDEXED_ENTITIES[entity]
+    ref = obj.get(ref_field, {})
+    date_str = obj.get("TxnDate") or ""
+    return {
+        "type": entity,
+        "id": obj.get("Id"),
+        "counterparty_kind": (ref.get("type") or default_kind).lower(),
+        "counterparty_id": ref.get("value"),
+        "counterparty": ref.get("name", "Unknown"),
+        "date": date_str,
+        "month": date_str[:7],
+        "amount": obj.get("TotalAmt", 0.0),
+        "balance": obj.get("Balance", 0.0),
+        "due_date": obj.get("DueDate") or date_str,
+    }
+
+
+class RealmIndex:
+    """
+    In-memory lookup structures over one realm's Invoices, Purchases and Bills:
+      - counterparty -> month -> transactions
+      - month -> transactions
+      - open-balance invoices sorted by due date
+
+    Built once from fetched entities, then kept current with upsert()/remove().
+    Lookups cost O(result), not O(all transactions).
+    """
+
+    def __init__(self, realm_id: str):
+        self.realm_id = realm_id
+        self._txns: Dict[TxnKey, dict] = {}
+        self._by_counterparty: Dict[Tuple[str, str], Dict[str, Dict[TxnKey, dict]]] = (
+            defaultdict(lambda: defaultdict(dict))
+        )
+        self._by_month: Dict[str, Dict[TxnKey, dict]] = defaultdict(dict)
+        self._open_by_due: List[Tuple[str, str]] = []  # (due_date, invoice Id)
+        self._stale: Set[TxnKey] = set()
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self.synced_at = datetime.now(timezone.utc)
+
+    # --- maintenance ---
+
+    def upsert(self, entity: str, obj: dict) -> None:
+        txn = _normalize(entity, obj)
+        key = (entity, txn["id"])
+        with self._lock:
+            self._remove(key)
+            self._txns[key] = txn
+            cp = (txn["counterparty_kind"], txn["counterparty_id"])
+            self._by_counterparty[cp][txn["month"]][key] = txn
+            self._by_month[txn["month"]][key] = txn
+            if entity == "Invoice" and txn["balance"] > 0:
+                insort(self._open_by_due, (txn["due_date"], txn["id"]))
+
+    def remove(self, entity: str, txn_id: str) -> None:
+        with self._lock:
+            self._remove((entity, txn_id))
+
+    def _remove(self, key: TxnKey) -> None:
+        txn = self._txns.pop(key, None)
+        if txn is None:
+            return
+        cp = (txn["counterparty_kind"], txn["counterparty_id"])
+        months = self._by_counterparty[cp]
+        months[txn["month"]].pop(key, None)
+        if not months[txn["month"]]:
+            del months[txn["month"]]
+        if not months:
+            del self._by_counterparty[cp]
+        self._by_month[txn["month"]].pop(key, None)
+        if not self._by_month[txn["month"]]:
+            del self._by_month[txn["month"]]
+        if key[0] == "Invoice":
+            entry = (txn["due_date"], txn["id"])
+            i = bisect_left(self._open_by_due, entry)
+            if i < len(self._open_by_due) and self._open_by_due[i] == entry:
+                del self._open_by_due[i]
+
+    def mark_stale(self, keys: Iterable[TxnKey]) -> None:
+        """
+        Flag transactions that changed upstream; refresh() re-reads them.
+        """
+        with self._lock:
+            self._stale.update(k for k in keys if k[0] in INDEXED_ENTITIES)
+
+    def refresh(self, qbo_client: QBOClient) -> int:
+        """
+        Re-fetch stale transactions by Id (dropping ones QBO no longer returns).
+        """
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        if not stale:
+            return 0
+
+        by_entity: Dict[str, List[str]] = defaultdict(list)
+        for entity, txn_id in stale:
+            by_entity[entity].append(txn_id)
+
+        pending = set(stale)
+        try:
+            for entity, ids in by_entity.items():
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    id_list = ", ".join(f"'{i}'" for i in chunk)
+                    found = {
+                        obj.get("Id"): obj
+                        for obj in qbo_client.iter_entities(entity, f"Id IN ({id_list})")
+                    }
+                    for txn_id in chunk:
+                        if txn_id in found:
+                            self.upsert(entity, found[txn_id])
+                        else:
+                            self.remove(entity, txn_id)
+                        pending.discard((entity, txn_id))
+        except Exception:
+            # Keep whatever was not applied for the next refresh.
+            with self._lock:
+                self._stale.update(pending)
+            raise
+        return len(stale)
+
+    def catch_up(self, qbo_client: QBOClient) -> bool:
+        """
+        Apply every change QBO reports via CDC since the last sync. This is
+        what keeps indexes on workers that never saw the webhook current.
+
+        Returns False, without applying anything, when the CDC response was
+        truncated: the index can no longer be repaired incrementally and must
+        be rebuilt.
+        """
+        with self._sync_lock:
+            started = datetime.now(timezone.utc)
+            if started - self.synced_at < INDEX_SYNC_INTERVAL:
+                return True
+            changes = qbo_client.change_data_capture(
+                list(INDEXED_ENTITIES),
+                self.synced_at.isoformat(timespec="seconds"),
+            )
+            if cdc_truncated(changes):
+                return False
+            for entity, objs in changes.items():
+                for obj in objs:
+                    if obj.get("status") == "Deleted":
+                        self.remove(entity, obj.get("Id"))
+                    else:
+                        self.upsert(entity, obj)
+            self.synced_at = started
+            return True
+
+    # --- lookups ---
+
+    def counterparty(self, kind: str, counterparty_id: str, month: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            months = self._by_counterparty.get((kind, counterparty_id), {})
+            if month is not None:
+                rows = list(months.get(month, {}).values())
+            else:
+                rows = [t for txns in months.values() for t in txns.values()]
+        return sorted(rows, key=lambda t: t["date"])
+
+    def month(self, month: str, entity: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            rows = list(self._by_month.get(month, {}).values())
+        if entity:
+            rows = [t for t in rows if t["type"] == entity]
+        return sorted(rows, key=lambda t: t["date"])
+
+    def open_invoices(self, due_after: Optional[str] = None, due_before: Optional[str] = None) -> List[dict]:
+        """
+        Open invoices with due_after <= DueDate <= due_before (ISO dates), by due date.
+        """
+        with self._lock:
+            lo = bisect_left(self._open_by_due, (due_after, "")) if due_after else 0
+            hi = (
+                bisect_right(self._open_by_due, (due_before, "\uffff"))
+                if due_before else len(self._open_by_due)
+            )
+            return [self._txns[("Invoice", i)] for _, i in self._open_by_due[lo:hi]]
+
+
+_indexes: "OrderedDict[str, RealmIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+
+def _build(qbo_client: QBOClient) -> RealmIndex:
+    index = RealmIndex(qbo_client.realm_id)
+    for entity in INDEXED_ENTITIES:
+        for obj in qbo_client.iter_entities(entity):
+            index.upsert(entity, obj)
+    return index
+
+
+def _store(realm_id: str, index: RealmIndex) -> None:
+    with _indexes_lock:
+        _indexes[realm_id] = index
+        _indexes.move_to_end(realm_id)
+        while len(_indexes) > MAX_INDEXED_REALMS:
+            evicted, _ = _indexes.popitem(last=False)
+            _build_locks.pop(evicted, None)
+
+
+def get_realm_index(qbo_client: QBOClient) -> RealmIndex:
+    """
+    Return the index for the client's realm, building it on first use (or
+    when CDC can no longer catch it up) and applying pending and
+    CDC-reported changes.
+    """
+    realm_id = qbo_client.realm_id
+    with _indexes_lock:
+        index = _indexes.get(realm_id)
+        if index is not None:
+            _indexes.move_to_end(realm_id)
+        build_lock = _build_locks[realm_id]
+
+    now = datetime.now(timezone.utc)
+    if (
+        index is None
+        or now - index.synced_at > CDC_MAX_AGE
+        or not index.catch_up(qbo_client)
+    ):
+        with build_lock:
+            with _indexes_lock:
+                current = _indexes.get(realm_id)
+            if current is not None and current is not index:
+                index = current
+            else:
+                index = _build(qbo_client)
+                _store(realm_id, index)
+
+    index.refresh(qbo_client)
+    return index
+
+
+def mark_stale(realm_id: str, keys: Iterable[TxnKey]) -> None:
+    """
+    Record upstream changes for a realm's index, if one has been built.
+    """
+    with _indexes_lock:
+        index = _indexes.get(realm_id)
+    if index is not None:
+        index.mark_stale(keys)
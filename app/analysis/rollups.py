@@ -0,0 +1,284 @@
+from ..cache import cache
+from ..db import advisory_xact_lock
+from ..qbo_client import QBOClient, cdc_truncated
+from ..models import MonthlyRollup, RollupCursor, RollupTxn
+from ..pack_cache import PNL_ENTITIES
+from .cashflow_forecast import PNL_GROUPS, add_months, monthly_pnl_groups
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Entities stored in the rollup ledger -> counterparty reference field.
+LEDGER_ENTITIES = {
+    "Invoice": "CustomerRef",
+    "Purchase": "EntityRef",
+    "Bill": "VendorRef",
+}
+
+# QBO's CDC endpoint only looks back 30 days; older cursors force a rebuild.
+CDC_MAX_AGE = timedelta(days=29)
+# Requests within this window of the last refresh read the tables as-is.
+REFRESH_INTERVAL = timedelta(seconds=60)
+# P&L history loaded on a full rebuild when the ledger is empty.
+DEFAULT_PNL_MONTHS = 24
+
+# Entities whose changes move the rollup tables.
+ROLLUP_ENTITIES = set(LEDGER_ENTITIES) | PNL_ENTITIES
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _ledger_values(entity: str, obj: dict) -> dict:
+    ref = obj.get(LEDGER_ENTITIES[entity], {})
+    return {
+        "month": (obj.get("TxnDate") or "")[:7],
+        "counterparty": ref.get("name", ""),
+        "amount": obj.get("TotalAmt", 0.0),
+    }
+
+
+def _month_range(first: str, last: str) -> List[str]:
+    d = date.fromisoformat(first + "-01")
+    end = date.fromisoformat(last + "-01")
+    months = []
+    while d <= end:
+        months.append(d.strftime("%Y-%m"))
+        d = add_months(d, 1)
+    return months
+
+
+def _rebuild_txn_months(db: Session, realm_id: str, months: Set[str]) -> None:
+    """
+    Re-aggregate monthly_rollups for the ledger types from rollup_txns,
+    touching only `months`.
+    """
+    if not months:
+        return
+    db.query(MonthlyRollup).filter(
+        MonthlyRollup.realm_id == realm_id,
+        MonthlyRollup.txn_type.in_(list(LEDGER_ENTITIES)),
+        MonthlyRollup.month.in_(months),
+    ).delete(synchronize_session=False)
+    db.flush()
+
+    aggregate = (
+        select(
+            RollupTxn.realm_id,
+            RollupTxn.month,
+            RollupTxn.counterparty,
+            RollupTxn.txn_type,
+            func.sum(RollupTxn.amount),
+            func.count(),
+        )
+        .where(RollupTxn.realm_id == realm_id, RollupTxn.month.in_(months))
+        .group_by(RollupTxn.realm_id, RollupTxn.month, RollupTxn.counterparty, RollupTxn.txn_type)
+    )
+    db.execute(
+        insert(MonthlyRollup).from_select(
+            ["realm_id", "month", "counterparty", "txn_type", "total", "count"],
+            aggregate,
+        )
+    )
+
+
+def _refresh_pnl_months(qbo_client: QBOClient, db: Session, first: str, last: str) -> None:
+    """
+    Replace the Income / COGS / Expenses rollup rows for first..last (YYYY-MM)
+    with a single monthly ProfitAndLoss report.
+    """
+    months = _month_range(first, last)
+    start = date.fromisoformat(first + "-01")
+    end = add_months(date.fromisoformat(last + "-01"), 1) - timedelta(days=1)
+    groups = monthly_pnl_groups(qbo_client, start, end)
+
+    db.query(MonthlyRollup).filter(
+        MonthlyRollup.realm_id == qbo_client.realm_id,
+        MonthlyRollup.txn_type.in_(PNL_GROUPS),
+        MonthlyRollup.month.in_(months),
+    ).delete(synchronize_session=False)
+    db.add_all(
+        MonthlyRollup(
+            realm_id=qbo_client.realm_id,
+            month=month,
+            counterparty="",
+            txn_type=group,
+            total=values[i],
+            count=0,
+        )
+        for group, values in groups.items()
+        for i, month in enumerate(months[:len(values)])
+    )
+
+
+def _changed_key(realm_id: str) -> str:
+    return f"rollups_changed:{realm_id}"
+
+
+def mark_rollups_changed(realm_id: str, entities: Iterable[str]) -> None:
+    """
+    Record that QBO reported a change (e.g. via webhook) to rollup entities,
+    so the next refresh_rollups runs CDC even within REFRESH_INTERVAL.
+    Entries older than the interval are moot, hence the TTL.
+    """
+    if ROLLUP_ENTITIES & set(entities):
+        cache.set(
+            _changed_key(realm_id),
+            datetime.now(timezone.utc).isoformat(),
+            ttl=REFRESH_INTERVAL.total_seconds(),
+        )
+
+
+def refresh_rollups(qbo_client: QBOClient, db: Session, force: bool = False) -> Dict[str, object]:
+    """
+    Bring a realm's rollup tables up to date.
+
+    Normally this pulls only rows changed since the last refresh (via CDC)
+    and re-aggregates just the months they touch; within REFRESH_INTERVAL
+    of the last refresh it does nothing unless mark_rollups_changed() was
+    called since. The first refresh, one
+    after more than CDC_MAX_AGE, or one whose CDC response was truncated
+    rebuilds the realm from scratch.
+    """
+    realm_id = qbo_client.realm_id
+    # Serializes refreshes per realm even before the first cursor row exists.
+    advisory_xact_lock(db, f"rollups:{realm_id}")
+    now = datetime.now(timezone.utc)
+    cursor = db.query(RollupCursor).filter(RollupCursor.realm_id == realm_id).first()
+
+    changed_at = cache.get(_changed_key(realm_id))
+    if (
+        cursor and not force
+        and now - _utc(cursor.changed_since) < REFRESH_INTERVAL
+        # A change reported after the last refresh started is not in the tables.
+        and not (changed_at and datetime.fromisoformat(changed_at) >= _utc(cursor.changed_since))
+    ):
+        db.commit()  # release the realm lock
+        return {"mode": "fresh", "months_refreshed": 0}
+
+    touched: Set[str] = set()
+    pnl_months: Set[str] = set()
+    pnl_full = False
+
+    changes = None
+    if cursor is not None and now - _utc(cursor.changed_since) <= CDC_MAX_AGE:
+        changes = qbo_client.change_data_capture(
+            sorted(set(LEDGER_ENTITIES) | PNL_ENTITIES),
+            _utc(cursor.changed_since).isoformat(),
+        )
+        if cdc_truncated(changes):
+            # Some changes were cut off; only a rebuild is complete.
+            changes = None
+
+    if changes is None:
+        mode = "rebuild"
+        db.query(RollupTxn).filter(RollupTxn.realm_id == realm_id).delete(synchronize_session=False)
+        db.query(MonthlyRollup).filter(MonthlyRollup.realm_id == realm_id).delete(synchronize_session=False)
+        for entity in LEDGER_ENTITIES:
+            for obj in qbo_client.iter_entities(entity):
+                values = _ledger_values(entity, obj)
+                db.add(RollupTxn(realm_id=realm_id, txn_type=entity, txn_id=obj.get("Id"), **values))
+                touched.add(values["month"])
+        pnl_full = True
+    else:
+        mode = "incremental"
+        for entity, objs in changes.items():
+            if entity not in LEDGER_ENTITIES:
+                for obj in objs:
+                    if obj.get("status") == "Deleted" or not obj.get("TxnDate"):
+                        pnl_full = True
+                    else:
+                        pnl_months.add(obj["TxnDate"][:7])
+                continue
+
+            existing = {
+                row.txn_id: row
+                for row in db.query(RollupTxn).filter(
+                    RollupTxn.realm_id == realm_id,
+                    RollupTxn.txn_type == entity,
+                    RollupTxn.txn_id.in_([o.get("Id") for o in objs]),
+                )
+            }
+            for obj in objs:
+                old = existing.get(obj.get("Id"))
+                if old is not None:
+                    touched.add(old.month)
+                if obj.get("status") == "Deleted":
+                    if old is not None:
+                        db.delete(old)
+                    continue
+                values = _ledger_values(entity, obj)
+                if old is None:
+                    db.add(RollupTxn(realm_id=realm_id, txn_type=entity, txn_id=obj.get("Id"), **values))
+                else:
+                    for k, v in values.items():
+                        setattr(old, k, v)
+                touched.add(values["month"])
+
+    db.flush()
+    _rebuild_txn_months(db, realm_id, touched)
+
+    current = now.strftime("%Y-%m")
+    dated = {m for m in touched | pnl_months if m}
+    if pnl_full:
+        default_first = add_months(
+            date(now.year, now.month, 1), -DEFAULT_PNL_MONTHS
+        ).strftime("%Y-%m")
+        if mode == "rebuild":
+            first = min(dated, default=None) or default_first
+        else:
+            # A P&L change without a usable date (e.g. a deletion) can move
+            # any month, so redo every month held, not just recently touched ones.
+            held = (
+                db.query(func.min(MonthlyRollup.month))
+                .filter(MonthlyRollup.realm_id == realm_id, MonthlyRollup.txn_type.in_(PNL_GROUPS))
+                .scalar()
+            )
+            first = min(m for m in (held, min(dated, default=None), default_first) if m)
+        _refresh_pnl_months(qbo_client, db, first, current)
+    elif dated:
+        _refresh_pnl_months(qbo_client, db, min(dated), min(max(dated), current))
+
+    if cursor is None:
+        db.add(RollupCursor(realm_id=realm_id, changed_since=now))
+    else:
+        cursor.changed_since = now
+    db.commit()
+
+    return {"mode": mode, "months_refreshed": len(touched | pnl_months)}
+
+
+# --- Queries (each a single aggregate over ix_monthly_rollups_realm_type_month) ---
+
+def totals_by_counterparty(db: Session, realm_id: str, txn_types: Iterable[str]) -> List[Tuple[str, float]]:
+    total = func.sum(MonthlyRollup.total)
+    rows = (
+        db.query(MonthlyRollup.counterparty, total)
+        .filter(MonthlyRollup.realm_id == realm_id, MonthlyRollup.txn_type.in_(list(txn_types)))
+        .group_by(MonthlyRollup.counterparty)
+        .order_by(total.desc())
+        .all()
+    )
+    return [(name, float(amount)) for name, amount in rows]
+
+
+def totals_by_month(
+    db: Session,
+    realm_id: str,
+    txn_types: Iterable[str],
+    first: Optional[str] = None,
+    last: Optional[str] = None,
+) -> List[Tuple[str, float]]:
+    query = db.query(MonthlyRollup.month, func.sum(MonthlyRollup.total)).filter(
+        MonthlyRollup.realm_id == realm_id,
+        MonthlyRollup.txn_type.in_(list(txn_types)),
+        MonthlyRollup.month != "",
+    )
+    if first:
+        query = query.filter(MonthlyRollup.month >= first)
+    if last:
+        query = query.filter(MonthlyRollup.month <= last)
+    rows = query.group_by(MonthlyRollup.month).order_by(MonthlyRollup.month).all()
+    return [(month, float(amount)) for month, amount in rows]
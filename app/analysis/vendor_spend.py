@@ -1,10 +1,27 @@
 from ..qbo_client import QBOClient
+from .rollups import refresh_rollups, totals_by_counterparty
 from collections import defaultdict
+from sqlalchemy.orm import Session
 
-def vendor_spend_summary(qbo_client: QBOClient, limit: int = 1000):
+def vendor_spend_summary(qbo_client: QBOClient, limit: int = 1000, db: Session | None = None):
     """
     Returns total spend per vendor across Bills and Expenses.
+
+    With `db`, answers from the monthly rollup tables (refreshed
+    incrementally first) instead of re-pulling entities; `limit` is ignored.
     """
+    if db is not None:
+        refresh_rollups(qbo_client, db)
+        sorted_vendors = [
+            (vendor or "Unknown Vendor", amount)
+            for vendor, amount in totals_by_counterparty(db, qbo_client.realm_id, ["Bill", "Purchase"])
+        ]
+        return {
+            "total_vendors": len(sorted_vendors),
+            "top_5_vendors": sorted_vendors[:5],
+            "vendor_breakdown": sorted_vendors,
+        }
+
     results = defaultdict(float)
 
     # Pull Bills
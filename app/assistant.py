@@ -4,11 +4,20 @@ from typing import Dict, Any
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from openai import OpenAI, RateLimitError
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
 from requests.exceptions import HTTPError
 
+from .config import settings
 from .db import get_db
+from .resilience import Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError
 from .qbo_client import get_qbo_client_from_db
+from .pack_cache import cached_pack, is_cached
 
 # Analysis packs
 from .analysis.vendor_spend import vendor_spend_summary
@@ -23,8 +32,48 @@ from .analysis.anomalies import transaction_anomalies
 
 router = APIRouter(prefix="/assistant", tags=["Peregrine CFO Assistant"])
 
-# OpenAI client (v2 library)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Queries issued by the analysis packs below (at their default limits).
+# Prefetching them in one /batch call turns ~8 query round trips into 1;
+# any query not listed here simply falls through to a normal request.
+PACK_QUERIES = [
+    "SELECT * FROM Bill STARTPOSITION 1 MAXRESULTS 1000",
+    "SELECT * FROM Purchase STARTPOSITION 1 MAXRESULTS 1000",
+    "SELECT * FROM Invoice STARTPOSITION 1 MAXRESULTS 1000",
+    "SELECT * FROM Invoice WHERE Balance > 0 STARTPOSITION 1 MAXRESULTS 1000",
+]
+
+# OpenAI client (v2 library). Hard per-call timeout and no SDK retries, so a
+# slow upstream costs at most llm_timeout seconds per request.
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=settings.llm_timeout,
+    max_retries=0,
+)
+
+# Limit how many worker threads can be parked on OpenAI at once, and fail
+# fast to a data-only answer while it is degraded. State is visible under
+# "llm.*" at /metrics.
+llm_bulkhead = Bulkhead(
+    "llm",
+    max_concurrent=settings.llm_max_concurrency,
+    queue_timeout=settings.llm_queue_timeout,
+)
+llm_breaker = CircuitBreaker(
+    "llm",
+    failure_threshold=settings.llm_breaker_failures,
+    reset_timeout=settings.llm_breaker_reset,
+    failure_exceptions=(
+        APITimeoutError,
+        APIConnectionError,
+        InternalServerError,
+        RateLimitError,
+    ),
+)
+
+DATA_ONLY_NOTE = (
+    "You can still inspect the raw data from each analysis pack in the "
+    "'analyses' field."
+)
 
 
 class AssistantQuery(BaseModel):
@@ -57,26 +106,39 @@ def ask_peregrine(body: AssistantQuery, db: Session = Depends(get_db)) -> Dict[s
     # Helper to run each pack defensively
     def run_pack(key: str, fn):
         try:
-            analyses[key] = fn(qbo)
+            analyses[key] = cached_pack(qbo.realm_id, key, {}, lambda: fn(qbo))
         except HTTPError as e:
             errors[key] = f"HTTP error from QBO: {e}"
         except Exception as e:
             errors[key] = f"Unexpected error: {e}"
 
     # 2) Run all analysis packs
-    run_pack("vendor_spend", vendor_spend_summary)
-    run_pack("customer_revenue", customer_revenue_summary)
-    run_pack("expense_trends", expense_trend_mom)
-    run_pack("profit_margins", profit_and_margin_by_month)
-    run_pack("cogs_anomalies", cogs_anomalies)
-    run_pack("cashflow_forecast", cashflow_forecast)
-    run_pack("ar_aging", ar_aging)
-    run_pack("transaction_anomalies", transaction_anomalies)
+    packs = {
+        "vendor_spend": vendor_spend_summary,
+        "customer_revenue": customer_revenue_summary,
+        "expense_trends": expense_trend_mom,
+        "profit_margins": profit_and_margin_by_month,
+        "cogs_anomalies": cogs_anomalies,
+        "cashflow_forecast": cashflow_forecast,
+        "ar_aging": ar_aging,
+        "transaction_anomalies": transaction_anomalies,
+    }
+
+    # Only pay for the batch round trip if some pack has to hit QBO.
+    if not all(is_cached(qbo.realm_id, key, {}) for key in packs):
+        try:
+            qbo.prefetch(PACK_QUERIES)
+        except Exception:
+            # Batch unavailable; each pack will fetch its own data instead.
+            pass
+
+    for key, fn in packs.items():
+        run_pack(key, fn)
 
     # 3) Call LLM to interpret the data
-    # If OpenAI quota is exhausted, fall back gracefully.
-    try:
-        response = client.chat.completions.create(
+    # If OpenAI is unavailable, slow or out of quota, fall back to data only.
+    def call_llm():
+        return client.chat.completions.create(
             model="gpt-4o-mini",  # or gpt-4.1 if your account has it
             messages=[
                 {
@@ -107,13 +169,28 @@ def ask_peregrine(body: AssistantQuery, db: Session = Depends(get_db)) -> Dict[s
             ],
         )
 
+    try:
+        response = llm_breaker.call(lambda: llm_bulkhead.run(call_llm))
         answer = response.choices[0].message.content
 
     except RateLimitError:
         answer = (
             "Peregrine CFO tried to run an AI analysis, but the OpenAI API reported "
-            "an insufficient quota or rate limit. You can still inspect the raw data "
-            "from each analysis pack in the 'analyses' field."
+            "an insufficient quota or rate limit. " + DATA_ONLY_NOTE
+        )
+    except CircuitOpenError:
+        answer = (
+            "Peregrine CFO's AI analysis is temporarily disabled because the OpenAI "
+            "API has been failing. " + DATA_ONLY_NOTE
+        )
+    except BulkheadFullError:
+        answer = (
+            "Peregrine CFO is handling too many AI analyses right now. " + DATA_ONLY_NOTE
+        )
+    except (APITimeoutError, APIConnectionError, InternalServerError):
+        answer = (
+            "Peregrine CFO tried to run an AI analysis, but the OpenAI API did not "
+            "respond in time. " + DATA_ONLY_NOTE
         )
 
     # 4) Return answer + raw data (useful for debugging or future UI features)
@@ -0,0 +1,228 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import settings
+from .db import engine
+from .models import CacheEntry
+
+
+class CacheBackend:
+    """
+    Minimal key/value interface for cached data and short-lived state.
+
+    Values must be JSON-serializable. Keys are namespaced strings such as
+    "oauth_state:<state>" or "pnl:<realm_id>:..." so related entries can be
+    dropped together with delete_prefix().
+    """
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Set `key` only if it is absent (or expired). Returns True if this call
+        stored the value; only one concurrent caller can win.
+        """
+        raise NotImplementedError
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """
+        Atomically read and remove `key`. Only one concurrent caller gets the value.
+        """
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        return 0
+
+    # Many keys (webhook_seen:*, superseded pack:* generations) are written
+    # once and never read again, so expired entries are purged every
+    # PURGE_EVERY writes rather than only at startup.
+    PURGE_EVERY = 1000
+
+    _writes = 0
+    _writes_lock = threading.Lock()
+
+    def _note_write(self) -> None:
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self.PURGE_EVERY == 0
+        if due:
+            self.purge_expired()
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process cache. Fine for a single worker; not shared across processes.
+    Holds at most `max_entries` keys, evicting the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, key: str, value: Any, expires: Optional[float]) -> None:
+        # Caller holds self._lock.
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _live(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._live(key)
+        return default if item is None else item[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._store(key, value, expires)
+        self._note_write()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, expires)
+        self._note_write()
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                return default
+            del self._data[key]
+        return item[0]
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            keys = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+
+class PostgresCache(CacheBackend):
+    """
+    Cache stored in the cache_entries table of the app database, so every
+    worker and node sharing DATABASE_URL sees the same entries.
+    """
+
+    def __init__(self, bind=engine):
+        self.engine = bind
+
+    @staticmethod
+    def _not_expired(now: datetime):
+        return (CacheEntry.expires_at.is_(None)) | (CacheEntry.expires_at > now)
+
+    def get(self, key, default=None):
+        stmt = select(CacheEntry.value).where(
+            CacheEntry.key == key, self._not_expired(datetime.utcnow())
+        )
+        with self.engine.connect() as conn:
+            raw = conn.execute(stmt).scalar()
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl is not None else None
+        stmt = insert(CacheEntry).values(key=key, value=json.dumps(value), expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheEntry.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+        self._note_write()
+
+    def delete(self, key):
+        with self.engine.begin() as conn:
+            conn.execute(delete(CacheEntry).where(CacheEntry.key == key))
+
+    def add(self, key, value, ttl=None):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl) if ttl is not None else None
+        stmt = insert(CacheEntry).values(key=key, value=json.dumps(value), expires_at=expires_at)
+        # Only overwrite a conflicting row if it has already expired.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheEntry.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+            where=CacheEntry.expires_at <= now,
+        )
+        with self.engine.begin() as conn:
+            stored = conn.execute(stmt).rowcount == 1
+        self._note_write()
+        return stored
+
+    def pop(self, key, default=None):
+        # DELETE ... RETURNING is atomic: concurrent callers cannot both see the row.
+        stmt = (
+            delete(CacheEntry)
+            .where(CacheEntry.key == key, self._not_expired(datetime.utcnow()))
+            .returning(CacheEntry.value)
+        )
+        with self.engine.begin() as conn:
+            raw = conn.execute(stmt).scalar()
+        return default if raw is None else json.loads(raw)
+
+    def delete_prefix(self, prefix):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        stmt = delete(CacheEntry).where(CacheEntry.key.like(escaped + "%", escape="\\"))
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+
+    def purge_expired(self):
+        stmt = delete(CacheEntry).where(CacheEntry.expires_at <= datetime.utcnow())
+        with self.engine.begin() as conn:
+            return conn.execute(stmt).rowcount
+
+
+def _build_cache() -> CacheBackend:
+    if settings.cache_backend == "postgres":
+        return PostgresCache()
+    if settings.cache_backend == "memory":
+        return MemoryCache()
+    raise RuntimeError(f"Unknown CACHE_BACKEND: {settings.cache_backend!r}")
+
+
+# Process-wide cache instance, selected by CACHE_BACKEND.
+cache: CacheBackend = _build_cache()
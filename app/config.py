@@ -9,7 +9,22 @@ class Settings(BaseModel):
     qbo_client_secret: str = os.getenv("QBO_CLIENT_SECRET", "")
     qbo_redirect_uri: str = os.getenv("QBO_REDIRECT_URI", "")
     qbo_environment: str = os.getenv("QBO_ENVIRONMENT", "sandbox")
+    # Overrides the Intuit API host, e.g. to point at a fake QBO for load tests.
+    qbo_base_url: str = os.getenv("QBO_BASE_URL", "")
     database_url: str = os.getenv("DATABASE_URL", "")
+    # "memory" (per process) or "postgres" (shared across workers via DATABASE_URL)
+    cache_backend: str = os.getenv("CACHE_BACKEND", "memory")
+    # Analysis results are invalidated by QBO webhooks, so this can be long --
+    # but only with the shared postgres backend; see pack_cache.pack_cache_ttl().
+    pack_cache_ttl: int = int(os.getenv("PACK_CACHE_TTL", "21600"))
+    qbo_webhook_verifier_token: str = os.getenv("QBO_WEBHOOK_VERIFIER_TOKEN", "")
+
+    # OpenAI call protection (see app/resilience.py)
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    llm_queue_timeout: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "30"))
+    llm_breaker_failures: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    llm_breaker_reset: float = float(os.getenv("LLM_BREAKER_RESET", "30"))
 
     @property
     def intuit_auth_base(self):
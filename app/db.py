@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from .config import settings
@@ -16,3 +16,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def advisory_xact_lock(db, key: str) -> None:
+    """
+    Serialize writers on `key` until the current transaction ends. Uses a
+    Postgres advisory lock, which works before any row exists to lock; other
+    backends (SQLite in local runs) already allow only one writer at a time.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
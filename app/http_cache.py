@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Optional: brotli is used when installed, gzip otherwise.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# GET routes that get ETags and compression.
+CACHEABLE_PREFIXES = ("/analysis/", "/companies")
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def etag_for(body: bytes) -> str:
+    # Weak: the same ETag covers identity, gzip and br encodings of the body.
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+async def etag_and_compression(request: Request, call_next):
+    """
+    For GET /analysis/* and /companies:
+      - tag 200 JSON responses with an ETag derived from the body and answer
+        a matching If-None-Match with 304 and no body;
+      - compress bodies over MIN_COMPRESS_SIZE with br or gzip per
+        Accept-Encoding.
+
+    Pack results come from the shared cache, so a revalidation costs a
+    cache read and a hash, not a QBO round trip or a multi-MB transfer.
+    NDJSON streams are passed through untouched.
+    """
+    if request.method != "GET" or not request.url.path.startswith(CACHEABLE_PREFIXES):
+        return await call_next(request)
+
+    response = await call_next(request)
+    content_type = response.headers.get("content-type", "")
+    if response.status_code != 200 or not content_type.startswith("application/json"):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = etag_for(body)
+
+    headers = {
+        k: v for k, v in response.headers.items()
+        if k.lower() not in ("content-length", "content-encoding", "etag")
+    }
+    headers["ETag"] = etag
+    headers["Vary"] = "Accept-Encoding"
+    headers.setdefault("Cache-Control", "no-cache")
+
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        headers.pop("content-type", None)
+        return Response(status_code=304, headers=headers)
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=200, headers=headers)
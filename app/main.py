@@ -1,12 +1,21 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from datetime import date
+from typing import List, Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 
+from .cache import cache
 from .db import Base, engine, get_db
-from .qbo_auth import router as qbo_auth_router
+from .qbo_auth import COMPANY_INFO_TTL, company_info_key, router as qbo_auth_router
+from .webhooks import router as qbo_webhook_router
 from .qbo_client import get_qbo_client_from_db, QBOClient
 from .models import QBOToken
+from .metrics import metrics
+from .http_cache import etag_and_compression
+from .pack_cache import cached_pack
+from .streaming import ndjson_response
 
 # Analysis modules
 from .analysis.basic_metrics import invoices_summary
@@ -16,8 +25,23 @@ from .analysis.expense_trends import expense_trend_mom
 from .analysis.profit_margin import profit_and_margin_by_month
 from .analysis.cogs_anomaly import cogs_anomalies
 from .analysis.cashflow_forecast import cashflow_forecast
-from .analysis.ar_aging import ar_aging
-from .analysis.anomalies import transaction_anomalies
+from .analysis.ar_aging import (
+    MAX_AS_OF_DATES,
+    ar_aging,
+    ar_aging_history,
+    ar_aging_page,
+    ar_aging_summary,
+    iter_ar_aging_rows,
+    month_ends,
+)
+from .analysis.indexes import get_realm_index
+from .analysis.anomaly_engine import flagged_anomalies, incremental_transaction_anomalies
+from .analysis.anomalies import (
+    transaction_anomalies,
+    transaction_anomalies_page,
+    transaction_anomalies_summary,
+    iter_scored_transactions,
+)
 
 # Optional AI assistant router
 try:
@@ -28,13 +52,16 @@ except ImportError:
 
 # --- App init ---
 Base.metadata.create_all(bind=engine)
+cache.purge_expired()
 app = FastAPI(title="Peregrine CFO")
+app.middleware("http")(etag_and_compression)
 
 # Static files (logo, etc.)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Routers
 app.include_router(qbo_auth_router)
+app.include_router(qbo_webhook_router)
 if ASSISTANT_ENABLED:
     app.include_router(assistant_router)
 
@@ -46,6 +73,11 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
+
+
 @app.get("/companies")
 def list_companies(db: Session = Depends(get_db)):
     """
@@ -53,30 +85,36 @@ def list_companies(db: Session = Depends(get_db)):
       - realm_id
       - name (CompanyName when available)
       - connected: True if token still works against QBO, else False
+
+    Name and status are cached per realm for COMPANY_INFO_TTL, so polling
+    this endpoint does not cost a QBO call per company every time.
     """
     tokens = db.query(QBOToken).all()
     companies = []
 
     for t in tokens:
-        client = QBOClient(access_token=t.access_token, realm_id=t.realm_id)
-        name = t.realm_id
-        connected = False
-
-        try:
-            info = client.get_company_info()
-            name = info.get("CompanyInfo", {}).get("CompanyName") or name
-            connected = True
-        except Exception:
-            # Token expired or QBO call failed
+        company = cache.get(company_info_key(t.realm_id))
+        if company is None:
+            client = QBOClient(access_token=t.access_token, realm_id=t.realm_id)
+            name = t.realm_id
             connected = False
 
-        companies.append(
-            {
+            try:
+                info = client.get_company_info()
+                name = info.get("CompanyInfo", {}).get("CompanyName") or name
+                connected = True
+            except Exception:
+                # Token expired or QBO call failed
+                connected = False
+
+            company = {
                 "realm_id": t.realm_id,
                 "name": name,
                 "connected": connected,
             }
-        )
+            cache.set(company_info_key(t.realm_id), company, ttl=COMPANY_INFO_TTL)
+
+        companies.append(company)
 
     return companies
 
@@ -87,63 +125,291 @@ def assistant_ui(request: Request):
 
 
 # --- Analysis routes ---
+# vendor-spend, customer-revenue and expense-trend accept source=rollup to
+# answer from the materialized monthly rollup tables.
 
 @app.get("/analysis/invoices-summary")
-def get_invoices_summary(limit: int = 50, db: Session = Depends(get_db)):
+def get_invoices_summary(
+    limit: int = 50,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     try:
-        client = get_qbo_client_from_db(db)
-        return invoices_summary(client, limit)
+        client = get_qbo_client_from_db(db, realm_id)
+        return cached_pack(
+            client.realm_id, "invoices_summary", {"limit": limit},
+            lambda: invoices_summary(client, limit),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/analysis/vendor-spend")
-def get_vendor_spend(limit: int = 1000, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return vendor_spend_summary(client, limit)
+def get_vendor_spend(
+    limit: int = 1000,
+    source: str = "qbo",
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "vendor_spend", {"limit": limit, "source": source},
+        lambda: vendor_spend_summary(client, limit, db if source == "rollup" else None),
+    )
 
 
 @app.get("/analysis/customer-revenue")
-def get_customer_revenue(limit: int = 1000, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return customer_revenue_summary(client, limit)
+def get_customer_revenue(
+    limit: int = 1000,
+    source: str = "qbo",
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "customer_revenue", {"limit": limit, "source": source},
+        lambda: customer_revenue_summary(client, limit, db if source == "rollup" else None),
+    )
 
 
 @app.get("/analysis/expense-trend")
-def get_expense_trend(limit: int = 1000, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return expense_trend_mom(client, limit)
+def get_expense_trend(
+    limit: int = 1000,
+    source: str = "qbo",
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "expense_trends", {"limit": limit, "source": source},
+        lambda: expense_trend_mom(client, limit, db if source == "rollup" else None),
+    )
 
 
 @app.get("/analysis/profit-margin")
-def get_profit_and_margin(db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return profit_and_margin_by_month(client)
+def get_profit_and_margin(
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "profit_margins", {},
+        lambda: profit_and_margin_by_month(client),
+    )
 
 
 @app.get("/analysis/cogs-anomalies")
-def get_cogs_anomalies(z_threshold: float = 2.0, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return cogs_anomalies(client, z_threshold)
+def get_cogs_anomalies(
+    z_threshold: float = 2.0,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "cogs_anomalies", {"z_threshold": z_threshold},
+        lambda: cogs_anomalies(client, z_threshold),
+    )
 
 
 @app.get("/analysis/cashflow-forecast")
-def get_cashflow_forecast(horizon_months: int = 3, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return cashflow_forecast(client, horizon_months)
+def get_cashflow_forecast(
+    horizon_months: int = 3,
+    mode: str = "simple",
+    years: int = Query(3, ge=1, le=10),
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "cashflow_forecast",
+        {"horizon_months": horizon_months, "mode": mode, "years": years},
+        lambda: cashflow_forecast(client, horizon_months, mode, years),
+    )
 
 
+# Detail-heavy routes below accept:
+#   - format=ndjson: stream the summary line first, then one detail row per line
+#   - page_size / cursor: return one page of detail rows plus next_cursor
+# With neither, the full response is returned as before.
+
 @app.get("/analysis/ar-aging")
-def get_ar_aging(limit: int = 1000, db: Session = Depends(get_db)):
-    client = get_qbo_client_from_db(db)
-    return ar_aging(client, limit)
+def get_ar_aging(
+    limit: int = 1000,
+    format: str = "json",
+    page_size: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    if format == "ndjson":
+        today = date.today()
+        return ndjson_response(
+            ar_aging_summary(client, limit, today),
+            iter_ar_aging_rows(client, limit, today),
+        )
+    if page_size or cursor:
+        return ar_aging_page(client, limit, page_size or 100, cursor)
+    return cached_pack(
+        client.realm_id, "ar_aging", {"limit": limit},
+        lambda: ar_aging(client, limit),
+    )
+
+
+@app.get("/analysis/ar-aging/history")
+def get_ar_aging_history(
+    as_of: Optional[List[date]] = Query(None),
+    months: int = Query(12, ge=1, le=120),
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Aging buckets as of each `as_of` date (repeatable, at most
+    MAX_AS_OF_DATES distinct dates), or by default the last `months`
+    month-ends.
+    """
+    dates = sorted(set(as_of)) if as_of else month_ends(months)
+    if len(dates) > MAX_AS_OF_DATES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_AS_OF_DATES} distinct as_of dates are allowed.",
+        )
+    client = get_qbo_client_from_db(db, realm_id)
+    return cached_pack(
+        client.realm_id, "ar_aging_history",
+        {"as_of": [d.isoformat() for d in dates]},
+        lambda: ar_aging_history(client, dates),
+    )
 
 
 @app.get("/analysis/transaction-anomalies")
 def get_transaction_anomalies(
     limit: int = 1000,
     z_threshold: float = 2.5,
+    format: str = "json",
+    page_size: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    if format == "ndjson":
+        summary = transaction_anomalies_summary(client, limit)
+        return ndjson_response(
+            summary,
+            iter_scored_transactions(client, summary, limit, z_threshold),
+        )
+    if page_size or cursor:
+        return transaction_anomalies_page(client, limit, z_threshold, page_size or 100, cursor)
+    return cached_pack(
+        client.realm_id, "transaction_anomalies",
+        {"limit": limit, "z_threshold": z_threshold},
+        lambda: transaction_anomalies(client, limit, z_threshold),
+    )
+
+
+@app.post("/analysis/transaction-anomalies/incremental")
+def run_incremental_transaction_anomalies(
+    z_threshold: float = 3.0,
+    min_history: int = 5,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Score only transactions created since the previous run, per counterparty,
+    and record the ones flagged.
+    """
+    client = get_qbo_client_from_db(db, realm_id)
+    return incremental_transaction_anomalies(client, db, z_threshold, min_history)
+
+
+@app.get("/analysis/transaction-anomalies/incremental")
+def get_incremental_transaction_anomalies(
+    since: Optional[date] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Anomalies flagged by previous incremental runs (read-only).
+    """
+    client = get_qbo_client_from_db(db, realm_id)
+    return {
+        "anomalies": flagged_anomalies(
+            db, client.realm_id, since.isoformat() if since else None, limit
+        ),
+    }
+
+
+# --- Drill-down routes (answered from the per-realm index) ---
+
+def _drilldown(rows):
+    return {
+        "count": len(rows),
+        "total_amount": sum(r["amount"] for r in rows),
+        "transactions": rows,
+    }
+
+
+@app.get("/analysis/customer/{customer_id}")
+def get_customer_drilldown(
+    customer_id: str,
+    month: Optional[str] = None,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    index = get_realm_index(client)
+    return dict(
+        _drilldown(index.counterparty("customer", customer_id, month)),
+        customer_id=customer_id,
+    )
+
+
+@app.get("/analysis/vendor/{vendor_id}")
+def get_vendor_drilldown(
+    vendor_id: str,
+    month: Optional[str] = None,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    client = get_qbo_client_from_db(db, realm_id)
+    index = get_realm_index(client)
+    return dict(
+        _drilldown(index.counterparty("vendor", vendor_id, month)),
+        vendor_id=vendor_id,
+    )
+
+
+@app.get("/analysis/period/{month}")
+def get_period_drilldown(
+    month: str,
+    type: Optional[str] = None,
+    realm_id: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    client = get_qbo_client_from_db(db)
-    return transaction_anomalies(client, limit, z_threshold)
+    """
+    Transactions in a month (YYYY-MM), optionally only one entity type.
+    """
+    client = get_qbo_client_from_db(db, realm_id)
+    index = get_realm_index(client)
+    return dict(_drilldown(index.month(month, type)), month=month)
+
+
+@app.get("/analysis/open-invoices")
+def get_open_invoices(
+    due_after: Optional[str] = None,
+    due_before: Optional[str] = None,
+    realm_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Open-balance invoices ordered by due date, optionally within a due-date range.
+    """
+    client = get_qbo_client_from_db(db, realm_id)
+    rows = get_realm_index(client).open_invoices(due_after, due_before)
+    return {
+        "count": len(rows),
+        "total_balance": sum(r["balance"] for r in rows),
+        "invoices": rows,
+    }
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, Text, UniqueConstraint
 from sqlalchemy.sql import func
 
 from .db import Base   # <-- THIS is crucial: imports Base from db.py
@@ -21,3 +21,123 @@ class QBOToken(Base):
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CacheEntry(Base):
+    """
+    Shared key/value cache rows used by PostgresCache (see app/cache.py).
+    Values are JSON-encoded; expires_at is NULL for entries without a TTL.
+    """
+    __tablename__ = "cache_entries"
+
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class AnomalyStat(Base):
+    """
+    Running amount statistics (Welford count/mean/M2) per realm, transaction
+    type and counterparty. counterparty == "" holds the baseline for the
+    whole transaction type.
+    """
+    __tablename__ = "anomaly_stats"
+    __table_args__ = (UniqueConstraint("realm_id", "txn_type", "counterparty"),)
+
+    id = Column(Integer, primary_key=True)
+    realm_id = Column(String, index=True, nullable=False)
+    txn_type = Column(String, nullable=False)
+    counterparty = Column(String, nullable=False)
+
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class AnomalyCursor(Base):
+    """
+    Per realm and transaction type: CreateTime of the newest transaction
+    already folded into anomaly_stats.
+    """
+    __tablename__ = "anomaly_cursors"
+    __table_args__ = (UniqueConstraint("realm_id", "txn_type"),)
+
+    id = Column(Integer, primary_key=True)
+    realm_id = Column(String, index=True, nullable=False)
+    txn_type = Column(String, nullable=False)
+    last_created = Column(String, nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class FlaggedAnomaly(Base):
+    """
+    A transaction the incremental detector flagged, with the baseline it was
+    scored against at the time.
+    """
+    __tablename__ = "flagged_anomalies"
+    __table_args__ = (UniqueConstraint("realm_id", "txn_type", "txn_id"),)
+
+    id = Column(Integer, primary_key=True)
+    realm_id = Column(String, index=True, nullable=False)
+    txn_type = Column(String, nullable=False)
+    txn_id = Column(String, nullable=False)
+    name = Column(String, nullable=True)
+    txn_date = Column(String, nullable=True)
+    amount = Column(Float, nullable=False)
+    z_score = Column(Float, nullable=False)
+    baseline = Column(String, nullable=False)
+    baseline_mean = Column(Float, nullable=False)
+    baseline_stdev = Column(Float, nullable=False)
+
+    flagged_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RollupTxn(Base):
+    """
+    Per-transaction contribution to monthly_rollups, kept so incremental
+    refreshes can retract a transaction's old amount when it changes.
+    """
+    __tablename__ = "rollup_txns"
+    __table_args__ = (UniqueConstraint("realm_id", "txn_type", "txn_id"),)
+
+    id = Column(Integer, primary_key=True)
+    realm_id = Column(String, index=True, nullable=False)
+    txn_type = Column(String, nullable=False)
+    txn_id = Column(String, nullable=False)
+    month = Column(String, nullable=False)  # YYYY-MM
+    counterparty = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+
+
+class MonthlyRollup(Base):
+    """
+    Per realm / month / counterparty / type sums and counts. Transaction
+    types are QBO entities (Invoice, Purchase, Bill); P&L lines are stored
+    as Income / COGS / Expenses with an empty counterparty.
+    """
+    __tablename__ = "monthly_rollups"
+    __table_args__ = (
+        UniqueConstraint("realm_id", "txn_type", "month", "counterparty"),
+        Index("ix_monthly_rollups_realm_type_month", "realm_id", "txn_type", "month"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    realm_id = Column(String, nullable=False)
+    month = Column(String, nullable=False)
+    counterparty = Column(String, nullable=False)
+    txn_type = Column(String, nullable=False)
+    total = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+
+
+class RollupCursor(Base):
+    """
+    When a realm's rollups were last brought up to date (CDC watermark).
+    """
+    __tablename__ = "rollup_cursors"
+
+    realm_id = Column(String, primary_key=True)
+    changed_since = Column(DateTime(timezone=True), nullable=False)
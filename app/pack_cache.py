@@ -0,0 +1,138 @@
+import hashlib
+import json
+import uuid
+from typing import Any, Callable, Dict, Iterable, Set
+
+from .cache import cache
+from .config import settings
+from .singleflight import SingleFlight
+
+# Entities whose changes can move the ProfitAndLoss report.
+PNL_ENTITIES = {
+    "Invoice",
+    "SalesReceipt",
+    "CreditMemo",
+    "RefundReceipt",
+    "Purchase",
+    "Bill",
+    "VendorCredit",
+    "JournalEntry",
+    "Deposit",
+}
+
+# Which QBO entities each analysis pack is derived from. A change to any of
+# them invalidates that pack's cached results for the realm.
+PACK_ENTITIES: Dict[str, Set[str]] = {
+    "invoices_summary": {"Invoice"},
+    "vendor_spend": {"Bill", "Purchase", "Vendor"},
+    "customer_revenue": {"Invoice", "Customer"},
+    "expense_trends": {"Purchase"},
+    "profit_margins": PNL_ENTITIES,
+    "cogs_anomalies": PNL_ENTITIES,
+    "cashflow_forecast": PNL_ENTITIES | {"Preferences"},
+    "ar_aging": {"Invoice", "Payment", "CreditMemo", "Customer"},
+    "ar_aging_history": {"Invoice", "Payment", "CreditMemo"},
+    "transaction_anomalies": {"Invoice", "Purchase", "Customer", "Vendor"},
+}
+
+# Cached raw datasets (cache key namespaces) and the entities behind them.
+DATASET_ENTITIES: Dict[str, Set[str]] = {
+    "pnl": PNL_ENTITIES | {"Preferences"},
+}
+
+
+# Webhook invalidation only runs on the worker that received the webhook.
+# With the per-process memory backend the other workers never see it, so
+# entries there must expire quickly regardless of PACK_CACHE_TTL.
+MEMORY_PACK_CACHE_TTL = 300  # seconds
+
+
+def pack_cache_ttl() -> int:
+    if settings.cache_backend == "postgres":
+        return settings.pack_cache_ttl
+    return min(settings.pack_cache_ttl, MEMORY_PACK_CACHE_TTL)
+
+
+# Identical concurrent pack requests share one computation.
+_flights = SingleFlight("packs")
+
+
+def _generation_key(realm_id: str, pack: str) -> str:
+    return f"packgen:{realm_id}:{pack}"
+
+
+def pack_key(realm_id: str, pack: str, params: Dict[str, Any]) -> str:
+    """
+    Cache key for one pack result. It embeds the pack's current generation,
+    which invalidate_entities() replaces: a computation that started before
+    an invalidation stores its (stale) result under the old generation,
+    where no later request looks, and cannot join later requests' flights.
+    """
+    generation = cache.get(_generation_key(realm_id, pack), "0")
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    return f"pack:{realm_id}:{pack}:{generation}:{digest}"
+
+
+def cached_pack(
+    realm_id: str,
+    pack: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Any],
+) -> Any:
+    """
+    Return the cached result of `pack` for (realm_id, params), computing and
+    storing it on a miss. Concurrent misses for the same key wait on a
+    single computation instead of each hitting QBO.
+    """
+    key = pack_key(realm_id, pack, params)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    def compute_and_store():
+        value = compute()
+        cache.set(key, value, ttl=pack_cache_ttl())
+        return value
+
+    return _flights.do(key, compute_and_store)
+
+
+def is_cached(realm_id: str, pack: str, params: Dict[str, Any]) -> bool:
+    return cache.get(pack_key(realm_id, pack, params)) is not None
+
+
+def affected_packs(entities: Iterable[str]) -> Set[str]:
+    changed = set(entities)
+    return {pack for pack, deps in PACK_ENTITIES.items() if deps & changed}
+
+
+def affected_datasets(entities: Iterable[str]) -> Set[str]:
+    changed = set(entities)
+    return {name for name, deps in DATASET_ENTITIES.items() if deps & changed}
+
+
+def invalidate_entities(realm_id: str, entities: Iterable[str]) -> Dict[str, Any]:
+    """
+    Drop every cached pack result and dataset for `realm_id` derived from
+    any of `entities`.
+    """
+    entities = set(entities)
+    packs = affected_packs(entities)
+    datasets = affected_datasets(entities)
+
+    removed = 0
+    for pack in packs:
+        # New generation first: later requests never read or wait on old keys.
+        cache.set(_generation_key(realm_id, pack), uuid.uuid4().hex[:12])
+        removed += cache.delete_prefix(f"pack:{realm_id}:{pack}:")
+    for dataset in datasets:
+        removed += cache.delete_prefix(f"{dataset}:{realm_id}:")
+
+    return {
+        "realm_id": realm_id,
+        "packs": sorted(packs),
+        "datasets": sorted(datasets),
+        "entries_removed": removed,
+    }
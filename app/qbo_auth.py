@@ -8,14 +8,28 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
+from .cache import cache
 from .config import settings
 from .db import get_db
 from .models import QBOToken
 
 router = APIRouter(prefix="/qbo", tags=["QBO Auth"])
 
-# Temporary in-memory store for OAuth state (OK for single internal user)
-oauth_state_store: dict[str, bool] = {}
+# OAuth state lives in the shared cache so the callback can land on any worker.
+OAUTH_STATE_TTL = 600  # seconds
+
+
+def _oauth_state_key(state: str) -> str:
+    return f"oauth_state:{state}"
+
+
+# /companies caches each realm's name and connection status this long;
+# the callback clears the entry so a reconnect shows up immediately.
+COMPANY_INFO_TTL = 300  # seconds
+
+
+def company_info_key(realm_id: str) -> str:
+    return f"company:{realm_id}"
 
 def get_basic_auth_header(client_id: str, client_secret: str) -> str:
     token = f"{client_id}:{client_secret}"
@@ -31,7 +45,7 @@ def authorize():
         raise HTTPException(status_code=500, detail="QBO OAuth not configured properly.")
 
     state = secrets.token_urlsafe(16)
-    oauth_state_store[state] = True
+    cache.set(_oauth_state_key(state), True, ttl=OAUTH_STATE_TTL)
 
     params = {
         "client_id": settings.qbo_client_id,
@@ -57,9 +71,8 @@ def callback(
     Handles Intuit redirect, exchanges code → access_token + refresh_token,
     and stores them in Postgres.
     """
-    if state not in oauth_state_store:
+    if not cache.pop(_oauth_state_key(state)):
         raise HTTPException(status_code=400, detail="Invalid OAuth state.")
-    oauth_state_store.pop(state, None)
 
     headers = {
         "Authorization": get_basic_auth_header(
@@ -121,6 +134,7 @@ def callback(
         )
 
     db.commit()
+    cache.delete(company_info_key(realmId))
 
     return {
         "message": "OAuth successful; tokens stored in Postgres.",
@@ -1,4 +1,5 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List, Union
+
 import requests
 from sqlalchemy.orm import Session
 
@@ -6,11 +7,35 @@ from .config import settings
 from .models import QBOToken
 
 
+class QBOBatchFault(Exception):
+    """
+    Raised (or returned) for a single item of a /batch call that QBO rejected.
+    """
+
+    def __init__(self, bid: str, fault: Dict[str, Any]):
+        self.bid = bid
+        self.fault = fault
+        errors = fault.get("Error", [])
+        message = "; ".join(
+            e.get("Detail") or e.get("Message", "") for e in errors
+        ) or fault.get("type", "Unknown fault")
+        super().__init__(f"QBO batch item {bid} failed: {message}")
+
+
 class QBOClient:
     """
     Thin wrapper around the QuickBooks Online Accounting API for a single company.
+
+    Queries are combined into a single /batch round trip only explicitly,
+    via batch_query() / prefetch(): clients are created per request and
+    used sequentially, so there are no concurrent query() calls to merge.
     """
 
+    # QBO accepts at most 30 operations per /batch request.
+    BATCH_MAX_ITEMS = 30
+    # /cdc returns at most this many objects per entity; see cdc_truncated().
+    CDC_MAX_OBJECTS = 1000
+
     def __init__(self, access_token: str, realm_id: str):
         self.access_token = access_token
         self.realm_id = realm_id
@@ -20,7 +45,13 @@ class QBOClient:
             if settings.qbo_environment == "sandbox"
             else "quickbooks.api.intuit.com"
         )
-        self.base_url = f"https://{base_domain}/v3/company/{self.realm_id}"
+        api_root = settings.qbo_base_url.rstrip("/") or f"https://{base_domain}"
+        self.base_url = f"{api_root}/v3/company/{self.realm_id}"
+
+        # Results of prefetch(), keyed by query string. Values are either the
+        # query response or the QBOBatchFault for that query.
+        self._prefetched: Dict[str, Union[Dict[str, Any], QBOBatchFault]] = {}
+        self._reports: Dict[tuple, Dict[str, Any]] = {}
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -43,13 +74,153 @@ class QBOClient:
         Run a QuickBooks SQL-like query, e.g.:
 
             SELECT * FROM Invoice STARTPOSITION 1 MAXRESULTS 50
+
+        Answered from prefetch() results when available, otherwise sent
+        directly.
         """
+        if query in self._prefetched:
+            result = self._prefetched[query]
+            if isinstance(result, QBOBatchFault):
+                raise result
+            return result
+
         url = f"{self.base_url}/query"
         params = {"query": query}
         resp = requests.get(url, headers=self._headers(), params=params)
         resp.raise_for_status()
         return resp.json()
 
+    def query_entities(
+        self,
+        entity: str,
+        where: str = "",
+        start: int = 1,
+        max_results: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch one page of `entity` rows, e.g. query_entities("Invoice", "Balance > 0").
+        """
+        clause = f" WHERE {where}" if where else ""
+        data = self.query(
+            f"SELECT * FROM {entity}{clause} STARTPOSITION {start} MAXRESULTS {max_results}"
+        )
+        return data.get("QueryResponse", {}).get(entity, [])
+
+    def iter_entities(
+        self,
+        entity: str,
+        where: str = "",
+        limit: Optional[int] = None,
+        page_size: int = 1000,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield `entity` rows page by page (QBO caps pages at 1000), stopping
+        after `limit` rows when given. Only one page is held in memory.
+        """
+        start = 1
+        while limit is None or start <= limit:
+            n = page_size if limit is None else min(page_size, limit - start + 1)
+            rows = self.query_entities(entity, where, start, n)
+            yield from rows
+            if len(rows) < n:
+                return
+            start += n
+
+    def change_data_capture(
+        self,
+        entities: List[str],
+        changed_since: str,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Call the /cdc endpoint: every `entities` row created, updated or
+        deleted since `changed_since` (ISO timestamp, at most 30 days ago).
+        Deleted rows carry status "Deleted" and little besides their Id.
+        Results are capped per entity, so check cdc_truncated() before
+        treating them as complete.
+        """
+        url = f"{self.base_url}/cdc"
+        params = {"entities": ",".join(entities), "changedSince": changed_since}
+        resp = requests.get(url, headers=self._headers(), params=params)
+        resp.raise_for_status()
+
+        changes: Dict[str, List[Dict[str, Any]]] = {e: [] for e in entities}
+        for cdc in resp.json().get("CDCResponse", []):
+            for qr in cdc.get("QueryResponse", []):
+                for entity in entities:
+                    changes[entity].extend(qr.get(entity, []))
+        return changes
+
+    def batch(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send raw BatchItemRequest operations to the /batch endpoint, e.g.:
+
+            client.batch([{"Query": "SELECT * FROM Bill MAXRESULTS 10"}])
+
+        Operations are split into chunks of BATCH_MAX_ITEMS. Returns one
+        BatchItemResponse per operation, in the same order as `operations`.
+        """
+        url = f"{self.base_url}/batch"
+        results: List[Dict[str, Any]] = []
+
+        for start in range(0, len(operations), self.BATCH_MAX_ITEMS):
+            chunk = operations[start:start + self.BATCH_MAX_ITEMS]
+            items = [
+                dict(op, bId=str(start + i)) for i, op in enumerate(chunk)
+            ]
+            resp = requests.post(
+                url,
+                headers=self._headers(),
+                json={"BatchItemRequest": items},
+            )
+            resp.raise_for_status()
+
+            by_bid = {
+                item.get("bId"): item
+                for item in resp.json().get("BatchItemResponse", [])
+            }
+            for item in items:
+                results.append(
+                    by_bid.get(
+                        item["bId"],
+                        {"bId": item["bId"], "Fault": {"type": "MissingResponse"}},
+                    )
+                )
+
+        return results
+
+    def batch_query(
+        self,
+        queries: List[str]
+    ) -> List[Union[Dict[str, Any], QBOBatchFault]]:
+        """
+        Run several queries in as few round trips as possible.
+
+        Each result has the same shape as query() would return; items QBO
+        rejected come back as QBOBatchFault instances instead of raising, so
+        one bad query does not fail the rest.
+        """
+        responses = self.batch([{"Query": q} for q in queries])
+
+        results: List[Union[Dict[str, Any], QBOBatchFault]] = []
+        for item in responses:
+            if "Fault" in item:
+                results.append(QBOBatchFault(item.get("bId", ""), item["Fault"]))
+            else:
+                results.append({"QueryResponse": item.get("QueryResponse", {})})
+        return results
+
+    def prefetch(self, queries: List[str]) -> None:
+        """
+        Batch-fetch `queries` up front so later query() calls with the same
+        query string are served without another round trip. Faults are
+        re-raised to whichever caller issues the failed query.
+        """
+        pending = [q for q in dict.fromkeys(queries) if q not in self._prefetched]
+        if not pending:
+            return
+        for q, result in zip(pending, self.batch_query(pending)):
+            self._prefetched[q] = result
+
     def get_report(
         self,
         report_name: str,
@@ -58,16 +229,32 @@ class QBOClient:
         """
         Call a QuickBooks Online report endpoint, e.g. ProfitAndLoss.
 
+        Reports are not supported by /batch, so identical calls made through
+        the same client are memoized instead.
+
         Example:
             client.get_report(
                 "ProfitAndLoss",
                 {"date_macro": "ThisFiscalYearToDate", "summarize_column_by": "Month"}
             )
         """
+        key = (report_name, tuple(sorted((params or {}).items())))
+        if key in self._reports:
+            return self._reports[key]
+
         url = f"{self.base_url}/reports/{report_name}"
         resp = requests.get(url, headers=self._headers(), params=params or {})
         resp.raise_for_status()
-        return resp.json()
+        self._reports[key] = resp.json()
+        return self._reports[key]
+
+
+def cdc_truncated(changes: Dict[str, List[Dict[str, Any]]]) -> bool:
+    """
+    True if any entity in a change_data_capture() result hit QBO's per-entity
+    cap, i.e. changes since the watermark may be missing.
+    """
+    return any(len(objs) >= QBOClient.CDC_MAX_OBJECTS for objs in changes.values())
 
 
 def get_qbo_client_from_db(
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Callable, Tuple, Type, TypeVar
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+
+class BulkheadFullError(Exception):
+    """No slot became free within the bulkhead's queue timeout."""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is rejecting calls while the upstream recovers."""
+
+
+class Bulkhead:
+    """
+    Caps how many calls to one dependency run at once, so a slow upstream
+    can only tie up `max_concurrent` worker threads. Callers wait at most
+    `queue_timeout` seconds for a slot.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, queue_timeout: float):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self._sem = threading.BoundedSemaphore(max_concurrent)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable[[], T]) -> T:
+        if not self._sem.acquire(timeout=self.queue_timeout):
+            metrics.incr(f"{self.name}.bulkhead.rejected")
+            raise BulkheadFullError(f"{self.name}: all slots busy")
+        with self._lock:
+            self._active += 1
+            metrics.set_gauge(f"{self.name}.bulkhead.active", self._active)
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._active -= 1
+                metrics.set_gauge(f"{self.name}.bulkhead.active", self._active)
+            self._sem.release()
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures (exceptions listed in
+    `failure_exceptions`) the circuit opens and calls fail fast with
+    CircuitOpenError. After `reset_timeout` seconds one trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    _STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        failure_exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        metrics.set_gauge(f"{self.name}.breaker.state", self._STATE_GAUGE[self.state])
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        metrics.incr(f"{self.name}.breaker.{state}")
+        metrics.set_gauge(f"{self.name}.breaker.state", self._STATE_GAUGE[state])
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    metrics.incr(f"{self.name}.breaker.rejected")
+                    raise CircuitOpenError(f"{self.name}: circuit open")
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics.incr(f"{self.name}.breaker.rejected")
+                    raise CircuitOpenError(f"{self.name}: circuit half-open, trial in flight")
+                self._trial_in_flight = True
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def _on_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            metrics.incr(f"{self.name}.breaker.failures")
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._trial_in_flight = False
+                self._opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        self._before_call()
+        try:
+            result = fn()
+        except self.failure_exceptions:
+            self._on_failure()
+            raise
+        except BaseException:
+            # Not an upstream health signal (e.g. a bad request or a full
+            # bulkhead): release a half-open trial without changing state.
+            with self._lock:
+                self._trial_in_flight = False
+            raise
+        self._on_success()
+        return result
@@ -0,0 +1,106 @@
+"""
+QBOClient backed by a realm snapshot (see app.snapshots), for running the
+analysis packs and benchmarks offline.
+"""
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .analysis.cashflow_forecast import PNL_GROUPS
+from .qbo_client import QBOClient
+from .snapshots import RealmSnapshot
+
+_QUERY_RE = re.compile(
+    r"SELECT \* FROM (\w+)(?: WHERE (.+?))?(?: STARTPOSITION (\d+))?(?: MAXRESULTS (\d+))?\s*$",
+    re.IGNORECASE,
+)
+
+# P&L group -> section title as QBO renders it.
+PNL_HEADERS = {"Income": "Income", "COGS": "Cost of Goods Sold", "Expenses": "Expenses"}
+
+
+class SnapshotQBOClient(QBOClient):
+    """
+    QBOClient stand-in answering query() and ProfitAndLoss reports from a
+    snapshot, so the analysis packs and benchmarks can run without QBO.
+    """
+
+    def __init__(self, snapshot: RealmSnapshot):
+        super().__init__(access_token="", realm_id=snapshot.realm_id)
+        self.snapshot = snapshot
+
+    def get_company_info(self) -> Dict[str, Any]:
+        return {"CompanyInfo": {"CompanyName": self.realm_id}}
+
+    def query(self, query: str) -> Dict[str, Any]:
+        m = _QUERY_RE.match(query.strip())
+        if not m:
+            raise ValueError(f"Unsupported snapshot query: {query}")
+        entity, where, start, max_results = m.groups()
+        cols = self.snapshot.tables.get(entity)
+        if cols is None:
+            return {"QueryResponse": {}}
+
+        indices = np.arange(len(cols["amount"]))
+        if where:
+            if re.fullmatch(r"\s*Balance\s*>\s*0\s*", where):
+                indices = np.flatnonzero(cols["balance"] > 0)
+            else:
+                raise ValueError(f"Unsupported snapshot filter: {where}")
+
+        start = int(start or 1)
+        max_results = int(max_results or 100)
+        page = indices[start - 1:start - 1 + max_results]
+        return {"QueryResponse": {entity: list(self.snapshot.entity_rows(entity, page))}}
+
+    def change_data_capture(self, entities: List[str], changed_since: str) -> Dict[str, List[Dict[str, Any]]]:
+        # A snapshot never changes.
+        return {e: [] for e in entities}
+
+    def get_report(self, report_name: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if report_name != "ProfitAndLoss" or "pnl" not in self.snapshot.tables:
+            raise ValueError(f"Report {report_name} is not in the snapshot")
+        params = params or {}
+        pnl = self.snapshot.tables["pnl"]
+        months = pnl["month"].tolist()
+
+        if "start_date" in params:
+            first, last = params["start_date"][:7], params["end_date"][:7]
+        else:
+            # Only the ThisFiscalYearToDate macro is used by the packs; treat
+            # it as calendar year to date.
+            today = date.today()
+            first, last = f"{today.year}-01", today.strftime("%Y-%m")
+        idx = [i for i, m in enumerate(months) if first <= m <= last]
+
+        columns = [{"ColTitle": "", "ColType": "Account"}]
+        columns += [
+            {"ColTitle": datetime.strptime(months[i], "%Y-%m").strftime("%b %Y"), "ColType": "Money"}
+            for i in idx
+        ]
+        columns.append({"ColTitle": "Total", "ColType": "Money"})
+
+        sections = []
+        for group in PNL_GROUPS:
+            values = [float(pnl[group][i]) for i in idx]
+            title = PNL_HEADERS[group]
+            cells = [{"value": f"Total {title}"}]
+            cells += [{"value": str(v)} for v in values]
+            cells.append({"value": str(sum(values))})
+            sections.append(
+                {
+                    "type": "Section",
+                    "group": group,
+                    "Header": {"ColData": [{"value": title}]},
+                    "Rows": {"Row": [{"type": "Data", "ColData": cells}]},
+                    "Summary": {"ColData": cells},
+                }
+            )
+
+        return {
+            "Header": {"ReportName": "ProfitAndLoss"},
+            "Columns": {"Column": columns},
+            "Rows": {"Row": sections},
+        }
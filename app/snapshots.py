@@ -0,0 +1,377 @@
+"""
+Compact on-disk snapshots of a realm's fetched entities and monthly P&L.
+
+File layout (little-endian):
+
+    8 bytes   magic b"PGSNAP\\0\\0"
+    4 bytes   format version (uint32)
+    4 bytes   manifest length N (uint32)
+    N bytes   manifest (UTF-8 JSON): realm, created_at, sha256 of the data
+              section, and for every column its dtype, offset and length
+    padding   to an 8-byte boundary
+    ...       data section: raw column buffers, each 8-byte aligned
+
+Numeric columns are stored as plain numpy buffers; string columns as an
+int64 offsets buffer plus a UTF-8 blob. load_snapshot() memory-maps the
+file and wraps the buffers without copying, so loading is O(manifest).
+Checking the data section against its sha256 reads the whole file, so it
+is opt-in (verify=True, or `info --verify`).
+
+This module has no database or QBO client dependencies, so snapshots can
+be read anywhere; app.snapshot_client serves them through the QBOClient
+interface.
+
+Usage:
+
+    python -m app.snapshots export --realm-id 123 --out realm-123.snap
+    python -m app.snapshots info --verify realm-123.snap
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .qbo_client import QBOClient
+
+MAGIC = b"PGSNAP\0\0"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sII")
+_EPOCH = date(1970, 1, 1).toordinal()
+MISSING_DATE = np.iinfo(np.int32).min
+
+# Exported entities -> counterparty reference field.
+SNAPSHOT_ENTITIES = {
+    "Invoice": "CustomerRef",
+    "Purchase": "EntityRef",
+    "Bill": "VendorRef",
+    "Payment": "CustomerRef",
+}
+# Payment Line[].LinkedTxn entries, one row per link (ar_aging_history needs them).
+PAYMENT_LINES = "payment_lines"
+
+
+class SnapshotError(Exception):
+    """Raised for unreadable, corrupt or incompatible snapshot files."""
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _date_to_days(value: Optional[str]) -> int:
+    if not value:
+        return MISSING_DATE
+    try:
+        return date.fromisoformat(value[:10]).toordinal() - _EPOCH
+    except ValueError:
+        return MISSING_DATE
+
+
+def _days_to_date(days: int) -> Optional[str]:
+    if days == MISSING_DATE:
+        return None
+    return date.fromordinal(int(days) + _EPOCH).isoformat()
+
+
+class StringColumn:
+    """
+    Read-only view over an offsets buffer and a UTF-8 blob; decodes on access.
+    """
+
+    def __init__(self, offsets: np.ndarray, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def tolist(self) -> List[str]:
+        return [self[i] for i in range(len(self))]
+
+
+# --- writing ---
+
+def _entity_columns(entity: str, rows: List[dict]) -> Dict[str, Any]:
+    ref_field = SNAPSHOT_ENTITIES[entity]
+    return {
+        "id": [str(r.get("Id", "")) for r in rows],
+        "txn_date": np.array([_date_to_days(r.get("TxnDate")) for r in rows], dtype="<i4"),
+        "due_date": np.array([_date_to_days(r.get("DueDate")) for r in rows], dtype="<i4"),
+        "amount": np.array([r.get("TotalAmt", 0.0) for r in rows], dtype="<f8"),
+        "balance": np.array([r.get("Balance", 0.0) for r in rows], dtype="<f8"),
+        "counterparty_id": [str(r.get(ref_field, {}).get("value", "")) for r in rows],
+        "counterparty_name": [r.get(ref_field, {}).get("name", "") for r in rows],
+    }
+
+
+def _payment_line_columns(payments: List[dict]) -> Dict[str, Any]:
+    payment, txn_id, txn_type, amount = [], [], [], []
+    for i, p in enumerate(payments):
+        for line in p.get("Line", []):
+            for link in line.get("LinkedTxn", []):
+                payment.append(i)
+                txn_id.append(str(link.get("TxnId", "")))
+                txn_type.append(link.get("TxnType", ""))
+                amount.append(line.get("Amount", 0.0))
+    return {
+        "payment": np.array(payment, dtype="<i4"),
+        "txn_id": txn_id,
+        "txn_type": txn_type,
+        "amount": np.array(amount, dtype="<f8"),
+    }
+
+
+def write_snapshot(
+    path: str,
+    realm_id: str,
+    entities: Dict[str, List[dict]],
+    pnl: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Write `entities` (entity name -> QBO rows) and an optional monthly P&L
+    ({"months": [...YYYY-MM], "Income": [...], "COGS": [...], "Expenses": [...]})
+    to `path`. Returns the manifest.
+    """
+    tables: Dict[str, Dict[str, Any]] = {
+        entity: _entity_columns(entity, rows) for entity, rows in entities.items()
+    }
+    if "Payment" in entities:
+        tables[PAYMENT_LINES] = _payment_line_columns(entities["Payment"])
+    if pnl is not None:
+        tables["pnl"] = {"month": list(pnl["months"])}
+        for group, values in pnl.items():
+            if group != "months":
+                tables["pnl"][group] = np.asarray(values, dtype="<f8")
+
+    buffers: List[bytes] = []
+    offset = 0
+
+    def add(buf: bytes) -> Dict[str, int]:
+        nonlocal offset
+        meta = {"offset": offset, "length": len(buf)}
+        padded = _align(len(buf))
+        buffers.append(buf + b"\0" * (padded - len(buf)))
+        offset += padded
+        return meta
+
+    columns: Dict[str, Dict[str, Any]] = {}
+    for table, cols in tables.items():
+        columns[table] = {}
+        for name, values in cols.items():
+            if isinstance(values, np.ndarray):
+                columns[table][name] = dict(add(values.tobytes()), dtype=values.dtype.str)
+            else:
+                encoded = [v.encode() for v in values]
+                offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+                np.cumsum([len(b) for b in encoded], out=offsets[1:])
+                columns[table][name] = {
+                    "dtype": "str",
+                    "offsets": add(offsets.tobytes()),
+                    "data": add(b"".join(encoded)),
+                }
+
+    data = b"".join(buffers)
+    manifest = {
+        "realm_id": realm_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "row_counts": {t: len(next(iter(c.values()))) if c else 0 for t, c in tables.items()},
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "columns": columns,
+    }
+    header = json.dumps(manifest, separators=(",", ":")).encode()
+    prefix = _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)) + header
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+
+    # Write beside the target and rename, so readers never map a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(prefix)
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return manifest
+
+
+def export_realm(path: str, qbo_client: "QBOClient", pnl_months: int = 24) -> Dict[str, Any]:
+    """
+    Fetch every Invoice, Purchase, Bill and Payment plus `pnl_months` of
+    monthly P&L for the client's realm and write them to `path`.
+    """
+    from .analysis.cashflow_forecast import add_months, monthly_pnl_groups
+
+    entities = {e: list(qbo_client.iter_entities(e)) for e in SNAPSHOT_ENTITIES}
+
+    today = date.today()
+    first = add_months(date(today.year, today.month, 1), -(pnl_months - 1))
+    groups = monthly_pnl_groups(qbo_client, first, today)
+    n = len(groups["Income"])
+    pnl = dict(groups, months=[add_months(first, i).strftime("%Y-%m") for i in range(n)])
+
+    return write_snapshot(path, qbo_client.realm_id, entities, pnl)
+
+
+# --- reading ---
+
+class RealmSnapshot:
+    """
+    A memory-mapped snapshot. `tables[table][column]` is a numpy array (or
+    StringColumn) backed directly by the file.
+    """
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise SnapshotError(f"{path}: truncated header")
+        buf = memoryview(self._mmap)
+
+        if len(buf) < _PREFIX.size:
+            raise SnapshotError(f"{path}: truncated header")
+        magic, version, header_len = _PREFIX.unpack_from(buf)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a snapshot file")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path}: unsupported format version {version}")
+
+        header_end = _PREFIX.size + header_len
+        if header_end > len(buf):
+            raise SnapshotError(f"{path}: truncated header")
+        try:
+            self.manifest = json.loads(bytes(buf[_PREFIX.size:header_end]))
+        except ValueError:  # includes UnicodeDecodeError / JSONDecodeError
+            raise SnapshotError(f"{path}: corrupt manifest")
+        if not isinstance(self.manifest, dict):
+            raise SnapshotError(f"{path}: corrupt manifest")
+        data = buf[_align(header_end):]
+        if verify and hashlib.sha256(data).hexdigest() != self.manifest.get("sha256"):
+            raise SnapshotError(f"{path}: checksum mismatch")
+
+        def view(meta):
+            start, length = meta["offset"], meta["length"]
+            if start < 0 or length < 0 or start + length > len(data):
+                raise SnapshotError(f"{path}: column extends past end of file")
+            return data[start:start + length]
+
+        self.tables: Dict[str, Dict[str, Any]] = {}
+        try:
+            for table, cols in self.manifest["columns"].items():
+                self.tables[table] = {}
+                for name, meta in cols.items():
+                    if meta["dtype"] == "str":
+                        offsets = np.frombuffer(view(meta["offsets"]), dtype="<i8")
+                        self.tables[table][name] = StringColumn(offsets, view(meta["data"]))
+                    else:
+                        self.tables[table][name] = np.frombuffer(view(meta), dtype=meta["dtype"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise SnapshotError(f"{path}: corrupt manifest")
+
+    @property
+    def realm_id(self) -> str:
+        return self.manifest["realm_id"]
+
+    def entity_rows(self, entity: str, indices: Optional[np.ndarray] = None) -> Iterator[dict]:
+        """
+        Rebuild QBO-shaped rows (the fields the analysis packs read).
+        """
+        cols = self.tables.get(entity)
+        if cols is None:
+            return
+        ref_field = SNAPSHOT_ENTITIES[entity]
+        lines = self.tables.get(PAYMENT_LINES) if entity == "Payment" else None
+        if indices is None:
+            indices = np.arange(len(cols["amount"]))
+        for i in indices:
+            row = {
+                "Id": cols["id"][i],
+                "TotalAmt": float(cols["amount"][i]),
+                "Balance": float(cols["balance"][i]),
+                ref_field: {
+                    "value": cols["counterparty_id"][i],
+                    "name": cols["counterparty_name"][i],
+                },
+            }
+            txn_date = _days_to_date(cols["txn_date"][i])
+            due_date = _days_to_date(cols["due_date"][i])
+            if txn_date:
+                row["TxnDate"] = txn_date
+            if due_date:
+                row["DueDate"] = due_date
+            if lines is not None:
+                # Lines are written in payment order, so each payment's links
+                # are one contiguous slice.
+                lo, hi = np.searchsorted(lines["payment"], [i, i + 1])
+                row["Line"] = [
+                    {
+                        "Amount": float(lines["amount"][j]),
+                        "LinkedTxn": [
+                            {"TxnId": lines["txn_id"][j], "TxnType": lines["txn_type"][j]}
+                        ],
+                    }
+                    for j in range(lo, hi)
+                ]
+            yield row
+
+    def close(self) -> None:
+        self.tables = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Caller still holds arrays backed by the mapping; it is
+            # released when they are garbage collected.
+            pass
+
+
+def load_snapshot(path: str, verify: bool = False) -> RealmSnapshot:
+    return RealmSnapshot(path, verify=verify)
+
+
+def main(argv=None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export or inspect realm snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="fetch a realm from QBO and write a snapshot")
+    export.add_argument("--realm-id")
+    export.add_argument("--out", required=True)
+    export.add_argument("--pnl-months", type=int, default=24)
+    info = sub.add_parser("info", help="print a snapshot's manifest summary")
+    info.add_argument("path")
+    info.add_argument("--verify", action="store_true", help="check the data checksum")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        from .db import SessionLocal
+        from .qbo_client import get_qbo_client_from_db
+
+        db = SessionLocal()
+        try:
+            client = get_qbo_client_from_db(db, args.realm_id)
+        finally:
+            db.close()
+        manifest = export_realm(args.out, client, args.pnl_months)
+    else:
+        manifest = load_snapshot(args.path, verify=args.verify).manifest
+
+    print(json.dumps(
+        {k: manifest[k] for k in ("realm_id", "created_at", "row_counts", "sha256")},
+        indent=2,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import base64
+import json
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type, Union
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """
+    Pack pagination state into an opaque, URL-safe cursor string.
+    """
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str,
+    fields: Dict[str, Union[Type, Tuple[Type, ...]]],
+    check: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> Dict[str, Any]:
+    """
+    Inverse of encode_cursor. `fields` maps every required key to its
+    type(s); `check` can add range checks on the decoded state. Raises a 400
+    for anything malformed, so a hand-edited cursor never reaches the caller.
+    """
+    invalid = HTTPException(status_code=400, detail="Invalid cursor.")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise invalid
+    if not isinstance(state, dict):
+        raise invalid
+    for key, kind in fields.items():
+        value = state.get(key)
+        # bool is an int subclass, but never a valid counter or amount.
+        if isinstance(value, bool) or not isinstance(value, kind):
+            raise invalid
+    if check is not None:
+        try:
+            ok = check(state)
+        except ValueError:
+            ok = False
+        if not ok:
+            raise invalid
+    return state
+
+
+def ndjson_response(summary: Dict[str, Any], rows: Iterable[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Stream newline-delimited JSON: the summary object on the first line,
+    then one detail row per line as `rows` is consumed.
+    """
+
+    def generate():
+        yield json.dumps(summary) + "\n"
+        for row in rows:
+            yield json.dumps(row) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+from typing import Any, Dict, List, Set, Tuple
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+
+from .cache import cache
+from .config import settings
+from .analysis.indexes import mark_stale
+from .analysis.rollups import mark_rollups_changed
+from .pack_cache import DATASET_ENTITIES, PACK_ENTITIES, invalidate_entities
+
+router = APIRouter(prefix="/qbo", tags=["QBO Webhooks"])
+
+# Intuit may redeliver a notification; remember the ones we have seen for a day.
+SEEN_TTL = 24 * 3600  # seconds
+
+# Per-realm queue of changed (entity name, Id) pairs awaiting invalidation.
+# Several notifications for the same realm collapse into a single pass.
+_pending: Dict[str, Set[Tuple[str, str]]] = {}
+_pending_lock = threading.Lock()
+
+# CloudEvents carry lowercase entity names ("journalentry"); map them back to
+# QBO's casing for the entities we track.
+_ENTITY_NAMES = {
+    name.lower(): name
+    for name in set().union(*PACK_ENTITIES.values(), *DATASET_ENTITIES.values())
+}
+
+
+def sign_payload(body: bytes, verifier_token: str) -> str:
+    """
+    Compute the intuit-signature header value for `body`. Also handy for
+    signing fake payloads when testing locally.
+    """
+    digest = hmac.new(verifier_token.encode(), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def verify_signature(body: bytes, signature: str, verifier_token: str) -> bool:
+    if not signature or not verifier_token:
+        return False
+    return hmac.compare_digest(sign_payload(body, verifier_token), signature)
+
+
+def _dicts(items: Any) -> List[Dict[str, Any]]:
+    # Signed but malformed payloads are skipped rather than failing the request
+    # (a 500 would only make Intuit redeliver them).
+    return [i for i in items if isinstance(i, dict)] if isinstance(items, list) else []
+
+
+def parse_notifications(payload: Any) -> List[Dict[str, str]]:
+    """
+    Flatten a webhook payload into entity change events:
+      {"realm_id", "name", "id", "operation", "last_updated"}
+
+    Accepts both the classic eventNotifications format and the CloudEvents
+    list format; entries of any other shape are ignored.
+    """
+    events = []
+
+    if isinstance(payload, dict):
+        for notification in _dicts(payload.get("eventNotifications")):
+            realm_id = notification.get("realmId")
+            change = notification.get("dataChangeEvent")
+            entities = change.get("entities") if isinstance(change, dict) else None
+            for e in _dicts(entities):
+                events.append(
+                    {
+                        "realm_id": realm_id,
+                        "name": e.get("name"),
+                        "id": e.get("id"),
+                        "operation": e.get("operation"),
+                        "last_updated": e.get("lastUpdated"),
+                    }
+                )
+    elif isinstance(payload, list):
+        # CloudEvents: type looks like "qbo.invoice.updated.v1"
+        for e in _dicts(payload):
+            event_type = e.get("type")
+            parts = event_type.split(".") if isinstance(event_type, str) else []
+            if len(parts) < 3:
+                continue
+            events.append(
+                {
+                    "realm_id": e.get("intuitaccountid"),
+                    "name": _ENTITY_NAMES.get(parts[1], parts[1].capitalize()),
+                    "id": e.get("intuitentityid"),
+                    "operation": parts[2].capitalize(),
+                    "last_updated": e.get("time"),
+                }
+            )
+
+    return [
+        e for e in events
+        if e["realm_id"] and isinstance(e["realm_id"], str)
+        and e["name"] and isinstance(e["name"], str)
+        and isinstance(e["id"], (str, type(None)))
+    ]
+
+
+def enqueue(events: List[Dict[str, str]]) -> Set[str]:
+    """
+    Queue new (not previously seen) events per realm. Returns the realms
+    that have work pending.
+    """
+    realms = set()
+    for e in events:
+        seen_key = (
+            f"webhook_seen:{e['realm_id']}:{e['name']}:{e['id']}:"
+            f"{e['operation']}:{e['last_updated']}"
+        )
+        if not cache.add(seen_key, True, ttl=SEEN_TTL):
+            continue
+        with _pending_lock:
+            _pending.setdefault(e["realm_id"], set()).add((e["name"], e["id"]))
+        realms.add(e["realm_id"])
+    return realms
+
+
+def drain_realm(realm_id: str) -> Dict[str, Any] | None:
+    """
+    Invalidate cached data for everything queued for `realm_id`, flag the
+    changed transactions in its drill-down index and make the next rollup
+    refresh pick the changes up.
+    """
+    with _pending_lock:
+        changes = _pending.pop(realm_id, None)
+    if not changes:
+        return None
+    names = {name for name, _ in changes}
+    mark_stale(realm_id, changes)
+    # Before invalidating, so a pack recomputed from rollups refreshes them.
+    mark_rollups_changed(realm_id, names)
+    return invalidate_entities(realm_id, names)
+
+
+@router.post("/webhook")
+async def qbo_webhook(request: Request, background_tasks: BackgroundTasks):
+    """
+    Receives QBO data change notifications. The signature is checked against
+    QBO_WEBHOOK_VERIFIER_TOKEN; invalidation runs after the response so
+    Intuit gets its 200 quickly.
+    """
+    body = await request.body()
+    signature = request.headers.get("intuit-signature", "")
+    if not verify_signature(body, signature, settings.qbo_webhook_verifier_token):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature.")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload.")
+
+    events = parse_notifications(payload)
+    realms = enqueue(events)
+    for realm_id in realms:
+        background_tasks.add_task(drain_realm, realm_id)
+
+    return {"received": len(events), "queued_realms": sorted(realms)}
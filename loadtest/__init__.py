@@ -0,0 +1 @@
+# Load-testing harness: fake QBO / OpenAI backends and a traffic driver
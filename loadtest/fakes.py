@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the QuickBooks Online API and the OpenAI chat API.
+
+Both run on a background ThreadingHTTPServer with configurable latency
+(mean seconds, +/- 50% jitter) and error rate, and need nothing beyond the
+standard library.
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+QUERY_RE = re.compile(
+    r"SELECT \* FROM (\w+)(?: WHERE (.+?))?"
+    r"(?: STARTPOSITION (\d+))?(?: MAXRESULTS (\d+))?\s*$",
+    re.IGNORECASE,
+)
+# WHERE conditions the fake understands; anything else is a ValidationFault,
+# as it would be from QBO, rather than silently matching every row.
+ID_IN_RE = re.compile(r"Id IN \((.*)\)", re.IGNORECASE)
+BALANCE_RE = re.compile(r"Balance\s*>\s*0", re.IGNORECASE)
+CREATED_AFTER_RE = re.compile(r"MetaData\.CreateTime\s*>\s*'([^']+)'", re.IGNORECASE)
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _validation_fault(message: str) -> Tuple[int, Any]:
+    return 400, {"Fault": {"Error": [{"Message": message}], "type": "ValidationFault"}}
+
+
+class _FakeServer:
+    """
+    Shared plumbing: background server, latency injection, error injection.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.port = port
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> int:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._dispatch(self, "GET")
+
+            def do_POST(self):
+                fake._dispatch(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self.port
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        if random.random() < self.error_rate:
+            status, payload = self.error_response()
+        else:
+            try:
+                status, payload = self.handle(method, urlparse(handler.path), body)
+            except Exception as e:
+                status, payload = 500, {"error": str(e)}
+
+        raw = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(raw)))
+        handler.end_headers()
+        handler.wfile.write(raw)
+
+    def error_response(self) -> Tuple[int, Any]:
+        return 503, {"error": "injected failure"}
+
+    def handle(self, method, url, body) -> Tuple[int, Any]:
+        raise NotImplementedError
+
+
+class FakeQBO(_FakeServer):
+    """
+    Serves /v3/company/{realm}/query, /batch, /cdc, /companyinfo and
+    /reports/ProfitAndLoss with deterministic per-realm data.
+    """
+
+    def __init__(self, entities_per_type: int = 500, **kwargs):
+        super().__init__(**kwargs)
+        self.entities_per_type = entities_per_type
+        self._data: Dict[str, Dict[str, List[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def error_response(self):
+        return 503, {"Fault": {"Error": [{"Message": "Service unavailable"}], "type": "SystemFault"}}
+
+    def _realm_data(self, realm_id: str) -> Dict[str, List[dict]]:
+        with self._lock:
+            if realm_id not in self._data:
+                self._data[realm_id] = self._generate(realm_id)
+            return self._data[realm_id]
+
+    def _generate(self, realm_id: str) -> Dict[str, List[dict]]:
+        rng = random.Random(zlib.crc32(realm_id.encode()))
+        today = date.today()
+        n = self.entities_per_type
+
+        def txn(i, ref_field, names):
+            txn_date = today - timedelta(days=rng.randint(0, 720))
+            cp = rng.randrange(len(names))
+            amount = round(rng.lognormvariate(6, 1), 2)
+            created = datetime.combine(txn_date, datetime.min.time()) + timedelta(
+                seconds=rng.randint(8 * 3600, 18 * 3600)
+            )
+            stamp = created.isoformat() + "-07:00"  # QBO reports Pacific time
+            return {
+                "Id": str(i + 1),
+                "TxnDate": txn_date.isoformat(),
+                "DueDate": (txn_date + timedelta(days=30)).isoformat(),
+                "TotalAmt": amount,
+                ref_field: {"value": str(cp + 1), "name": names[cp]},
+                "MetaData": {"CreateTime": stamp, "LastUpdatedTime": stamp},
+            }
+
+        customers = [f"Customer {i}" for i in range(1, 41)]
+        vendors = [f"Vendor {i}" for i in range(1, 31)]
+
+        invoices = [txn(i, "CustomerRef", customers) for i in range(n)]
+        for inv in invoices:
+            inv["Balance"] = inv["TotalAmt"] if rng.random() < 0.3 else 0.0
+        purchases = [txn(i, "EntityRef", vendors) for i in range(n)]
+        bills = [txn(i, "VendorRef", vendors) for i in range(n)]
+
+        return {
+            "Invoice": invoices,
+            "Purchase": purchases,
+            "Bill": bills,
+            "Payment": [],
+            "Preferences": [{"AccountingInfoPrefs": {"FirstMonthOfFiscalYear": "January"}}],
+        }
+
+    def _run_query(self, realm_id: str, query: str) -> Tuple[int, Any]:
+        m = QUERY_RE.match(query.strip())
+        if not m:
+            return _validation_fault("Unparseable query")
+        entity, where, start, max_results = m.groups()
+        rows = self._realm_data(realm_id).get(entity, [])
+
+        for condition in re.split(r"\s+AND\s+", where or "", flags=re.IGNORECASE):
+            condition = condition.strip()
+            if not condition:
+                continue
+            ids = ID_IN_RE.fullmatch(condition)
+            created_after = CREATED_AFTER_RE.fullmatch(condition)
+            if ids:
+                wanted = {x.strip(" '") for x in ids.group(1).split(",")}
+                rows = [r for r in rows if r.get("Id") in wanted]
+            elif BALANCE_RE.fullmatch(condition):
+                rows = [r for r in rows if r.get("Balance", 0) > 0]
+            elif created_after:
+                try:
+                    after = _parse_time(created_after.group(1))
+                except ValueError:
+                    return _validation_fault(f"Invalid date in: {condition}")
+                rows = [
+                    r for r in rows
+                    if _parse_time(r["MetaData"]["CreateTime"]) > after
+                ]
+            else:
+                return _validation_fault(f"Unsupported WHERE condition: {condition}")
+
+        start = int(start or 1)
+        max_results = int(max_results or 100)
+        page = rows[start - 1:start - 1 + max_results]
+        return 200, {"QueryResponse": {entity: page, "startPosition": start, "maxResults": len(page)}}
+
+    def _profit_and_loss(self, realm_id: str, params: Dict[str, str]) -> Dict[str, Any]:
+        today = date.today()
+        if "start_date" in params:
+            start = date.fromisoformat(params["start_date"])
+            end = date.fromisoformat(params["end_date"])
+        else:
+            start, end = date(today.year, 1, 1), today
+
+        months = []
+        d = date(start.year, start.month, 1)
+        while d <= end:
+            months.append(d)
+            d = date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+        def section(group, title, base):
+            values = []
+            for mo in months:
+                rng = random.Random(zlib.crc32(f"{realm_id}:{group}:{mo}".encode()))
+                values.append(round(base * (1 + 0.3 * rng.random()), 2))
+            cells = [{"value": f"Total {title}"}] + [{"value": str(v)} for v in values]
+            cells.append({"value": str(round(sum(values), 2))})
+            return {
+                "type": "Section",
+                "group": group,
+                "Header": {"ColData": [{"value": title}]},
+                "Rows": {"Row": [{"type": "Data", "ColData": cells}]},
+                "Summary": {"ColData": cells},
+            }
+
+        columns = [{"ColTitle": "", "ColType": "Account"}]
+        columns += [{"ColTitle": mo.strftime("%b %Y"), "ColType": "Money"} for mo in months]
+        columns.append({"ColTitle": "Total", "ColType": "Money"})
+
+        return {
+            "Header": {"ReportName": "ProfitAndLoss"},
+            "Columns": {"Column": columns},
+            "Rows": {
+                "Row": [
+                    section("Income", "Income", 50000),
+                    section("COGS", "Cost of Goods Sold", 20000),
+                    section("Expenses", "Expenses", 15000),
+                ]
+            },
+        }
+
+    def handle(self, method, url, body):
+        m = re.match(r"/v3/company/([^/]+)/(.*)", url.path)
+        if not m:
+            return 404, {"error": "not found"}
+        realm_id, rest = m.groups()
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if rest == "query":
+            return self._run_query(realm_id, params.get("query", ""))
+        if rest == "batch" and method == "POST":
+            items = json.loads(body or b"{}").get("BatchItemRequest", [])
+            responses = []
+            for item in items:
+                status, payload = self._run_query(realm_id, item.get("Query", ""))
+                if status == 200:
+                    responses.append({"bId": item.get("bId"), "QueryResponse": payload["QueryResponse"]})
+                else:
+                    responses.append({"bId": item.get("bId"), "Fault": payload["Fault"]})
+            return 200, {"BatchItemResponse": responses}
+        if rest == "cdc":
+            # Fake data never changes, so there is nothing to report.
+            entities = params.get("entities", "").split(",")
+            return 200, {"CDCResponse": [{"QueryResponse": [{e: []} for e in entities if e]}]}
+        if rest.startswith("companyinfo/"):
+            return 200, {"CompanyInfo": {"CompanyName": f"Load Test Co {realm_id}"}}
+        if rest == "reports/ProfitAndLoss":
+            return 200, self._profit_and_loss(realm_id, params)
+        return 404, {"error": f"unsupported path {rest}"}
+
+
+class FakeOpenAI(_FakeServer):
+    """
+    Serves POST /v1/chat/completions with a canned answer. Injected errors
+    are 429s, which the OpenAI SDK surfaces as RateLimitError.
+    """
+
+    def error_response(self):
+        return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+
+    def handle(self, method, url, body):
+        if method != "POST" or not url.path.endswith("/chat/completions"):
+            return 404, {"error": {"message": "not found"}}
+        request = json.loads(body or b"{}")
+        return 200, {
+            "id": "chatcmpl-loadtest",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "Load test answer."},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
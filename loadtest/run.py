@@ -0,0 +1,241 @@
+"""
+Capacity test for app.main:app against fake QBO and OpenAI backends.
+
+    python -m loadtest.run --realms 20 --users 50 --duration 60 \\
+        --qbo-latency 0.2 --qbo-error-rate 0.01 --llm-latency 2.0 --workers 4
+
+Starts both fakes, seeds a throwaway SQLite database with one token per
+realm, launches uvicorn with the app pointed at the fakes, then drives a
+weighted mix of /companies, /analysis/* and /assistant/query traffic from
+--users concurrent clients. Prints throughput, p50/p95/p99 latency and
+error rate per route (and optionally writes them as JSON).
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import requests
+
+from .fakes import FakeOpenAI, FakeQBO
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (route label, method, path template, weight). {realm} / {cp} are filled per request.
+TRAFFIC_MIX = [
+    ("/companies", "GET", "/companies", 4),
+    ("/analysis/vendor-spend", "GET", "/analysis/vendor-spend?realm_id={realm}", 10),
+    ("/analysis/customer-revenue", "GET", "/analysis/customer-revenue?realm_id={realm}", 10),
+    ("/analysis/expense-trend", "GET", "/analysis/expense-trend?realm_id={realm}", 8),
+    ("/analysis/profit-margin", "GET", "/analysis/profit-margin?realm_id={realm}", 10),
+    ("/analysis/cogs-anomalies", "GET", "/analysis/cogs-anomalies?realm_id={realm}", 5),
+    ("/analysis/cashflow-forecast", "GET", "/analysis/cashflow-forecast?realm_id={realm}", 8),
+    ("/analysis/ar-aging", "GET", "/analysis/ar-aging?realm_id={realm}", 10),
+    ("/analysis/transaction-anomalies", "GET", "/analysis/transaction-anomalies?realm_id={realm}", 8),
+    ("/analysis/customer/{id}", "GET", "/analysis/customer/{cp}?realm_id={realm}", 7),
+    ("/assistant/query", "POST", "/assistant/query", 10),
+]
+
+
+def seed_tokens(db_path: str, realms: List[str]) -> None:
+    """
+    Create the qbo_tokens table the app expects and insert one token per realm.
+    """
+    now = datetime.utcnow()
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS qbo_tokens ("
+        "id INTEGER PRIMARY KEY, realm_id VARCHAR UNIQUE NOT NULL, "
+        "access_token VARCHAR NOT NULL, refresh_token VARCHAR NOT NULL, "
+        "access_expires_at DATETIME NOT NULL, refresh_expires_at DATETIME NOT NULL, "
+        "created_at DATETIME, updated_at DATETIME)"
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO qbo_tokens "
+        "(realm_id, access_token, refresh_token, access_expires_at, refresh_expires_at) "
+        "VALUES (?, 'fake-access', 'fake-refresh', ?, ?)",
+        [(r, now + timedelta(hours=1), now + timedelta(days=100)) for r in realms],
+    )
+    conn.commit()
+    conn.close()
+
+
+def start_app(port: int, workers: int, env: Dict[str, str]) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=REPO_ROOT,
+        env=dict(os.environ, **env),
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("App exited during startup.")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return proc
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("App did not become healthy within 30s.")
+
+
+def drive(
+    base_url: str,
+    realms: List[str],
+    users: int,
+    duration: float,
+    timeout: float,
+) -> Dict[str, List[Tuple[float, bool]]]:
+    """
+    Run `users` client threads for `duration` seconds. Returns
+    route label -> [(latency_seconds, ok)].
+    """
+    results: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+    lock = threading.Lock()
+    weights = [w for *_, w in TRAFFIC_MIX]
+    deadline = time.time() + duration
+
+    def user(seed: int):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.time() < deadline:
+            label, method, path, _ = rng.choices(TRAFFIC_MIX, weights)[0]
+            realm = rng.choice(realms)
+            url = base_url + path.format(realm=realm, cp=rng.randint(1, 40))
+            started = time.perf_counter()
+            try:
+                if method == "POST":
+                    resp = session.post(
+                        url,
+                        json={"question": "How is cash flow trending?", "realm_id": realm},
+                        timeout=timeout,
+                    )
+                else:
+                    resp = session.get(url, timeout=timeout)
+                ok = resp.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[label].append((elapsed, ok))
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(results: Dict[str, List[Tuple[float, bool]]], duration: float) -> List[Dict]:
+    rows = []
+    everything = []
+    for label, samples in sorted(results.items()):
+        everything.extend(samples)
+        rows.append(_route_stats(label, samples, duration))
+    rows.append(_route_stats("TOTAL", everything, duration))
+    return rows
+
+
+def _route_stats(label: str, samples: List[Tuple[float, bool]], duration: float) -> Dict:
+    latencies = sorted(s[0] for s in samples)
+    errors = sum(1 for s in samples if not s[1])
+    return {
+        "route": label,
+        "requests": len(samples),
+        "rps": len(samples) / duration if duration else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "error_rate": errors / len(samples) if samples else 0.0,
+    }
+
+
+def print_report(rows: List[Dict]) -> None:
+    header = f"{'route':<36}{'reqs':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['route']:<36}{r['requests']:>8}{r['rps']:>9.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+            f"{r['error_rate']:>8.1%}"
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--realms", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--entities", type=int, default=500, help="fake rows per entity type per realm")
+    parser.add_argument("--qbo-latency", type=float, default=0.1)
+    parser.add_argument("--qbo-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request client timeout")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    qbo = FakeQBO(args.entities, latency=args.qbo_latency, error_rate=args.qbo_error_rate)
+    llm = FakeOpenAI(latency=args.llm_latency, error_rate=args.llm_error_rate)
+    qbo_port, llm_port = qbo.start(), llm.start()
+
+    realms = [f"loadtest-{i}" for i in range(1, args.realms + 1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "loadtest.db")
+        seed_tokens(db_path, realms)
+
+        app = start_app(
+            args.port,
+            args.workers,
+            {
+                "DATABASE_URL": f"sqlite:///{db_path}",
+                "QBO_BASE_URL": f"http://127.0.0.1:{qbo_port}",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+                "OPENAI_API_KEY": "fake",
+                "CACHE_BACKEND": "memory",
+            },
+        )
+        try:
+            results = drive(
+                f"http://127.0.0.1:{args.port}", realms, args.users, args.duration, args.timeout
+            )
+        finally:
+            app.terminate()
+            app.wait()
+            qbo.stop()
+            llm.stop()
+
+    rows = summarize(results, args.duration)
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()